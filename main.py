@@ -1,17 +1,24 @@
 # Modules
 import pygame
+import os
 import sys
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pygame.constants import *
 
 # Scripts
 from scripts.camera import Window
 from scripts.settings import Settings
-from scripts.entities import Player, ModifiedSpriteGroup, UserCursor
-from scripts.animation import load_animations
-from scripts.input import Controller, Keyboard, controller_check
+from scripts.entities import Entity, Player, ModifiedSpriteGroup, UserCursor
+from scripts.bundle import load_assets
+from scripts.animation import AssetRegistry, AnimationSystem
+from scripts.input import Controller, Keyboard, ScriptedInput, InputRouter, controller_check
 from scripts.weapons import *
-from scripts.constants import BASE_IMG_PATH
+from scripts.projectiles import ProjectileSystem
+from scripts.spatial import Broadphase
+from scripts.combat import HitResolver
+from scripts.constants import BASE_IMG_PATH, HEADLESS_RESOLUTION
 
 # configure the logger
 logging.basicConfig(
@@ -32,21 +39,38 @@ class PauseMenu():
     pass
 
 class Game():
-    def __init__(self):
+    def __init__(self, headless=False):
         # initialisation
         logging.basicConfig(filename="game.log", level=logging.INFO)
+        self.headless = headless  # runs without a display, sound or real input devices
+        if headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+            os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
         pygame.init()
-        pygame.mixer.init()
+        if not headless:
+            pygame.mixer.init()
+            pygame.joystick.init()
         pygame.font.init()
-        pygame.joystick.init()
 
         # core properties
-        self.settings = Settings()
-        self.window = Window(self.settings.resolution, flags=pygame.FULLSCREEN | pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.SCALED)
+        self.settings = Settings(HEADLESS_RESOLUTION if headless else None)
+        self.window = Window(self.settings.resolution, flags=pygame.FULLSCREEN | pygame.HWSURFACE | pygame.DOUBLEBUF | pygame.SCALED, headless=headless)
         self.clock = pygame.time.Clock()
-        self.assets = load_animations(BASE_IMG_PATH)
+        if self.settings.lazyAssets:
+            self.assets = AssetRegistry(BASE_IMG_PATH, workers=self.settings.loadWorkers)
+            self.assets.preload(["newPlayer", "cursor", "gun", "bullet1"])
+        else:
+            self.assets = load_assets(BASE_IMG_PATH, workers=self.settings.loadWorkers)
         self.inputDevices = []
+        self.inputRouter = InputRouter()
+        self.tick = 0  # the number of updates run
         self.dt = 1
+        self.frameTime = 0
+        self.accumulator = 0
+        self.animations = AnimationSystem()
+        Entity.animationSystem = self.animations
+        self.renderer = None  # the render thread when rendering is pipelined
+        self.renderFuture = None  # the frame being drawn on the render thread
 
         # game properties
         self.entities = ModifiedSpriteGroup()
@@ -55,12 +79,22 @@ class Game():
         self.cursors = ModifiedSpriteGroup()
         self.bullets = ModifiedSpriteGroup()
         self.state = "running"
+        self.broadphase = Broadphase()
+        self.tileGrid = None  # the solid tiles of the current map
+        self.hitResolver = HitResolver()
+        self.hitEvents = []  # the hits of the last update
 
         # bullets
         self.DEFAULT_BULLET = Bullet((0, 0), (5, 2), "bullet1", self.assets, 0)
+        self.bulletPool = BulletPool()
+        self.bulletPool.preallocate(self.DEFAULT_BULLET, 64)
+        self.projectiles = None
+        if self.settings.projectileSystem:
+            self.projectiles = ProjectileSystem()
+            self.window.world.add_projectiles(self.projectiles)
 
         # weapons
-        self.DEFAULT_WEAPON = Weapon((0, 0),(8, 0), (8, 6), "gun", self.assets, bullet=self.DEFAULT_BULLET, camLayer=5, pivot=(-6, 0))
+        self.DEFAULT_WEAPON = Weapon((0, 0),(8, 0), (8, 6), "gun", self.assets, bullet=self.DEFAULT_BULLET, camLayer=5, pivot=(-6, 0), atlasStep=2)
     
     # creates a player and assigns them a controller
     def create_player(self, pos, input=0, layer=0):
@@ -77,14 +111,17 @@ class Game():
         player.input = input
         player.cursor = cursor
         player.weapon = weapon
+        weapon.owner = player  # set before the first update, the player can shoot before its weapon updates
 
         # add to sprite groups
         self.players.add(player)
+        self.broadphase.add(player)
         self.cursors.add(cursor)
         self.weapons.add(weapon)
 
         self.window.world.add(player, cursor, weapon)
         self.window.foreground.add(cursor)
+        self.inputRouter.compile(self.players)
 
     def add_to_world(self, *sprites):
         self.window.world.add(*sprites)
@@ -106,32 +143,109 @@ class Game():
         logger.info("Detected %s input devices", len(self.inputDevices))
 
     def calculate_deltatime(self):
-        self.dt = self.clock.tick() / 1000
+        self.frameTime = self.clock.tick(self.settings.targetFPS) / 1000
+        self.dt = self.frameTime
+
+    # runs the simulation in fixed steps for the time the frame took, the leftover time is used to interpolate drawing
+    def fixed_update(self):
+        step = 1 / self.settings.simulationRate
+        maxSteps = self.settings.maxSimulationSteps
+        self.accumulator += self.frameTime
+
+        steps = 0
+        while self.accumulator >= step and steps < maxSteps:
+            self.store_previous()
+            self.dt = step
+            self.update()
+            self.accumulator -= step
+            steps += 1
+
+        # drop the time that could not be caught up on instead of trying to catch up forever
+        if self.accumulator >= step:
+            logger.debug("Simulation fell behind by %.3fs", self.accumulator)
+            self.accumulator %= step
+        self.window.world.interpolation = self.accumulator / step
+
+    # keeps the state before a step to interpolate from
+    def store_previous(self):
+        self.window.world.store_previous()
+        if self.projectiles is not None:
+            self.projectiles.store_previous()
     
     # draws the window
     def draw(self):
-        self.window.draw_world(fill=(150, 150, 150))
-        self.window.draw_foreground()
-        self.window.draw()
-        pygame.display.flip()
+        # the ui screen is read by the render thread, so it is only redrawn once the last frame is finished
+        if self.settings.pipelinedRendering:
+            self.wait_for_render()
+        self.window.draw_ui()
+        snapshot = self.window.snapshot(fill=(150, 150, 150))
+        if self.settings.pipelinedRendering:
+            self.draw_pipelined(snapshot)
+        else:
+            self.window.render(snapshot)
+            self.flip()
+
+    def flip(self):
+        if not self.headless:
+            pygame.display.flip()
+
+    # shows the last frame once the render thread has finished it
+    def wait_for_render(self):
+        if self.renderFuture is not None:
+            self.renderFuture.result()
+            self.renderFuture = None
+            self.flip()
+
+    # starts drawing the new snapshot on the render thread while the next frame is simulated
+    def draw_pipelined(self, snapshot):
+        if self.renderer is None:
+            self.renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+        self.wait_for_render()
+        self.renderFuture = self.renderer.submit(self.window.render, snapshot)
+
+    # waits for the last frame and stops the render thread
+    def stop_renderer(self):
+        self.wait_for_render()
+        if self.renderer is not None:
+            self.renderer.shutdown()
+            self.renderer = None
     
     def update(self):
+        self.tick += 1
         self.window.update()
+        self.animations.update(self.dt)
 
+        colliders = self.broadphase if self.tileGrid is None else (self.tileGrid, self.broadphase)
         player: Player
         for player in self.players:
-            player.update([], self.dt, self.window.world, self)
+            player.update(colliders, self.dt, self.window.world, self)
         
         for bullet in self.bullets:
             bullet.update(self.dt)
 
+        if self.projectiles is not None:
+            self.projectiles.update(self.dt)
+
+        # hits are resolved for every bullet at once after everything has moved
+        self.hitEvents = self.hitResolver.resolve(self.damageable_entities(), self.bullets, self.projectiles)
+        self.hitResolver.apply(self.hitEvents, self.projectiles)
+
+    # entities bullets can hit
+    def damageable_entities(self):
+        return [entity for group in (self.players, self.entities) for entity in group if entity.isDamageable]
+
     def event_handler(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.state = ""
 
-            for player in self.players:
-                player.event_handler(event, self)
+            self.inputRouter.route(event, self)
+
+        # scripted events only go to the player the script drives
+        for player in self.players:
+            if isinstance(player.input, ScriptedInput):
+                for event in player.input.get_events(self.tick):
+                    player.event_handler(event, self)
 
     def run(self):
         self.detect_inputs()
@@ -142,12 +256,47 @@ class Game():
             pygame.mouse.set_visible(False)
             self.calculate_deltatime()
             self.event_handler()
-            self.update()
+            if self.settings.fixedTimestep:
+                self.fixed_update()
+            else:
+                self.update()
             self.draw()
             #print(int(self.clock.get_fps()))
-            
+        self.stop_renderer()
+
+    # runs the simulation for a number of ticks as fast as possible, with a player for each input script
+    def run_headless(self, ticks, scripts=({},), render=False):
+        self.inputDevices = [ScriptedInput(self.settings.keyboard, script) for script in scripts]
+        for i in range(len(self.inputDevices)):
+            self.create_player((200 + i * 50, 20), i, layer=1)
+        self.window.world.set_targets(*[self.players.get_entity(i) for i in range(len(self.players.sprites()))])
+
+        step = 1 / self.settings.simulationRate
+        start = time.perf_counter()
+        for i in range(ticks):
+            self.event_handler()
+            if self.state != "running":
+                break
+            self.store_previous()
+            self.dt = step
+            self.update()
+            if render:
+                self.draw()
+        self.stop_renderer()
+        seconds = time.perf_counter() - start
+
+        stats = {"ticks": self.tick, "seconds": seconds, "ticksPerSecond": self.tick / seconds if seconds > 0 else 0.0}
+        logger.info("Ran %s headless ticks in %.3fs (%.0f ticks/s)", self.tick, seconds, stats["ticksPerSecond"])
+        return stats
+
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    # python main.py --headless [ticks] runs the simulation without a display
+    if "--headless" in sys.argv:
+        args = sys.argv[sys.argv.index("--headless") + 1:]
+        game = Game(headless=True)
+        game.run_headless(int(args[0]) if args else 600)
+    else:
+        game = Game()
+        game.run()
     pygame.quit()
     sys.exit()
\ No newline at end of file
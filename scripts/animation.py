@@ -2,70 +2,370 @@
 import pygame
 import json
 import os
+import time
 import logging
+import weakref
+import numpy as np
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+# Scripts
+from scripts.atlas import TextureAtlas
 
 logger = logging.getLogger(__name__)
 
 # Animation System
 class Animation:
-    def __init__(self, images, img_dur=0.2, loop=True):
+    """
+    The frames, frame duration and looping of an animation. Animations are shared between every entity playing them and are not changed by playback, the playback of each entity is kept in an AnimationState.
+    """
+    __slots__ = ("images", "regions", "loop", "img_duration", "playing")
+
+    def __init__(self, images, img_dur=0.2, loop=True, regions=None):
         self.images = images
+        self.regions = regions  # (atlas page, rect) of each image when packed into an atlas
         self.loop = loop
         self.img_duration = img_dur
-        self.done = False
+        self.playing = 0  # the number of live states playing the animation
+
+    # Returns a new playback of the animation
+    def copy(self):
+        return AnimationState(self)
+
+# Moves the count of a state playing an animation from one animation to another
+def switch_clip(old: Animation, new: Animation):
+    if new is not old:
+        if old is not None:
+            old.playing -= 1
+        if new is not None:
+            new.playing += 1
+
+# The playback of a shared animation by one entity
+class AnimationState:
+    __slots__ = ("clip", "frame", "time_elapsed", "done")
+    isBatched = False  # the state is advanced by an AnimationSystem instead of its own update
+
+    def __init__(self, clip: Animation):
+        self.clip = None
+        self.play(clip)
+
+    # starts playing an animation from its first frame
+    def play(self, clip: Animation):
+        switch_clip(self.clip, clip)
+        self.clip = clip
         self.frame = 0
         self.time_elapsed = 0
-    
-    # Returns a copy of itself
-    def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
-    
+        self.done = False
+
     # Updates the current frame (uses deltatime)
     def update(self, dt):
+        clip = self.clip
         self.time_elapsed += dt
-        while self.time_elapsed >= self.img_duration:
-            self.time_elapsed -= self.img_duration
-            if self.loop:
-                self.frame = (self.frame + 1) % len(self.images)
+        while self.time_elapsed >= clip.img_duration:
+            self.time_elapsed -= clip.img_duration
+            if clip.loop:
+                self.frame = (self.frame + 1) % len(clip.images)
             else:
-                self.frame = min(self.frame + 1, len(self.images) - 1)
-                if self.frame == len(self.images) - 1:
+                self.frame = min(self.frame + 1, len(clip.images) - 1)
+                if self.frame == len(clip.images) - 1:
                     self.done = True
-    
+
     # Returns the current frame
     def img(self):
-        return self.images[self.frame]
-    
+        return self.clip.images[self.frame]
+
+    def __del__(self):
+        switch_clip(self.clip, None)
+
+# The playback of a shared animation stored in a slot of an AnimationSystem
+class BatchedAnimationState:
+    __slots__ = ("clip", "system", "slot", "__weakref__")
+    isBatched = True
+
+    def __init__(self, system, slot, clip: Animation):
+        self.system = system
+        self.slot = slot
+        self.clip = None
+        self.play(clip)
+        # the slot is freed when the state is no longer used
+        weakref.finalize(self, system.release, slot)
+
+    def play(self, clip: Animation):
+        switch_clip(self.clip, clip)
+        self.clip = clip
+        self.system.play(self.slot, clip)
+
+    @property
+    def frame(self):
+        return int(self.system.frames[self.slot])
+
+    @property
+    def done(self):
+        return bool(self.system.done[self.slot])
+
+    # the system updates every state at once, callers skip this by checking isBatched
+    def update(self, dt):
+        pass
+
+    def img(self):
+        return self.clip.images[self.system.frames[self.slot]]
+
+    def __del__(self):
+        switch_clip(self.clip, None)
+
+class AnimationSystem:
+    """
+    Keeps the playback of many animations in arrays and advances all of them in one vectorized step per frame.
+    """
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.size = 0
+        self.free = []
+        self.frames = np.zeros(0, dtype=np.int32)
+        self.elapsed = np.zeros(0, dtype=np.float64)
+        self.durations = np.zeros(0, dtype=np.float64)
+        self.lengths = np.zeros(0, dtype=np.int32)
+        self.loops = np.zeros(0, dtype=bool)
+        self.done = np.zeros(0, dtype=bool)
+        self.grow(capacity)
+
+    # makes room for more slots, free slots never advance
+    def grow(self, capacity):
+        extra = capacity - self.capacity
+        self.frames = np.concatenate((self.frames, np.zeros(extra, dtype=np.int32)))
+        self.elapsed = np.concatenate((self.elapsed, np.zeros(extra, dtype=np.float64)))
+        self.durations = np.concatenate((self.durations, np.full(extra, np.inf)))
+        self.lengths = np.concatenate((self.lengths, np.ones(extra, dtype=np.int32)))
+        self.loops = np.concatenate((self.loops, np.ones(extra, dtype=bool)))
+        self.done = np.concatenate((self.done, np.zeros(extra, dtype=bool)))
+        self.capacity = capacity
+
+    # returns a new state playing an animation
+    def create(self, clip: Animation):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow(self.capacity * 2)
+            slot = self.size
+            self.size += 1
+        return BatchedAnimationState(self, slot, clip)
+
+    def play(self, slot, clip: Animation):
+        self.frames[slot] = 0
+        self.elapsed[slot] = 0
+        self.durations[slot] = clip.img_duration if clip.img_duration > 0 else np.inf
+        self.lengths[slot] = max(1, len(clip.images))
+        self.loops[slot] = clip.loop
+        self.done[slot] = False
+
+    def release(self, slot):
+        self.durations[slot] = np.inf
+        self.free.append(slot)
+
+    # advances every animation
+    def update(self, dt):
+        n = self.size
+        if n == 0:
+            return
+        elapsed = self.elapsed[:n]
+        durations = self.durations[:n]
+        elapsed += dt
+        steps = np.floor(elapsed / durations)
+        elapsed -= steps * np.where(steps > 0, durations, 0)
+        frames = self.frames[:n] + steps.astype(np.int32)
+        lengths = self.lengths[:n]
+        last = lengths - 1
+        self.frames[:n] = np.where(self.loops[:n], frames % lengths, np.minimum(frames, last))
+        self.done[:n] |= ~self.loops[:n] & (self.frames[:n] == last) & (steps > 0)
+
 # Loads an image using its location   
 def load_image(path):
     img = pygame.image.load(path).convert_alpha()
     return img
     
+# Lists the image files in a directory
+def list_images(path):
+    return [os.path.join(path, img_name) for img_name in sorted(os.listdir(path)) if os.path.isfile(os.path.join(path, img_name))]
+
 # Loads a group of images in a directory
 def load_images(path):
     images = []
-    for img_name in sorted(os.listdir(path)):
-        img_path = os.path.join(path, img_name)
-        if os.path.isfile(img_path):
-            img = load_image(img_path)
-            if img:
-                images.append(img)
+    for img_path in list_images(path):
+        img = load_image(img_path)
+        if img:
+            images.append(img)
     return images
 
-def load_animations(base_path, data="data/animation_data.json"):
+# Decodes an image without converting it, returns the time it took
+def decode_image(path):
+    start = time.perf_counter()
+    img = pygame.image.load(path)
+    return img, time.perf_counter() - start
+
+# Moves the images of every animation into shared atlas pages
+def pack_animations(assets, pageSize=1024):
+    animations = [animation for animation in assets.values() if animation.images]
+    images = [img for animation in animations for img in animation.images]
+    regions = TextureAtlas(pageSize).pack(images)
+
+    i = 0
+    for animation in animations:
+        count = len(animation.images)
+        animation.regions = regions[i:i + count]
+        animation.images = [page.subsurface(rect) for page, rect in animation.regions]
+        i += count
+    return assets
+
+def load_animations(base_path, data="data/animation_data.json", atlas=True, workers=1):
     assets = {}
     with open(data, "rb") as file:
         data = json.load(file)
     
+    directories = {}
     for root, dirs, files in os.walk(base_path):
         for dir_name in dirs:
             dir_path = os.path.join(root, dir_name)
             relative_path = os.path.relpath(dir_path, base_path).replace("\\", "/")
-            logger.info("Loading animations from directory: %s", dir_path)  # Debug info
-            if relative_path in data:
-                assets[relative_path] = Animation(load_images(dir_path), data[relative_path]["img_dur"], data[relative_path]["loop"])
-            else:
-                assets[relative_path] = Animation(load_images(dir_path))
+            directories[relative_path] = (dir_path, list_images(dir_path))
+
+    # decoding can run on other threads, converting needs the main thread
+    paths = [path for dir_path, files in directories.values() for path in files]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            decoded = list(executor.map(decode_image, paths))
+    else:
+        decoded = [decode_image(path) for path in paths]
+
+    i = 0
+    for relative_path, (dir_path, files) in directories.items():
+        start = time.perf_counter()
+        results = decoded[i:i + len(files)]
+        images = [img.convert_alpha() for img, decodeTime in results]
+        i += len(files)
+        logger.info("Loaded animations from directory: %s (%s images, %.2fms decoding, %.2fms converting)", dir_path, len(images), sum(decodeTime for img, decodeTime in results) * 1000, (time.perf_counter() - start) * 1000)
+        if relative_path in data:
+            assets[relative_path] = Animation(images, data[relative_path]["img_dur"], data[relative_path]["loop"])
+        else:
+            assets[relative_path] = Animation(images)
     
+    if atlas:
+        pack_animations(assets)
+
     logger.debug("Animation keys added: %s", assets.keys())  # 
-    return assets
\ No newline at end of file
+    return assets
+
+class AssetRegistry(Mapping):
+    """
+    A lazy replacement for the dict returned by load_animations. Every animation directory is indexed up front but its images are only loaded the first time the animation is requested. Preloaded animations are pinned, and once the loaded animations go over the memory budget the least recently used ones that no entity is playing and have not been requested for idleTime seconds are unloaded.
+    """
+    def __init__(self, base_path, data="data/animation_data.json", maxBytes=64 * 1024 * 1024, idleTime=30, workers=1):
+        with open(data, "rb") as file:
+            self.data = json.load(file)
+        self.maxBytes = maxBytes
+        self.idleTime = idleTime
+        self.workers = workers
+
+        # animation key -> directory
+        self.index = {}
+        for root, dirs, files in os.walk(base_path):
+            for dir_name in dirs:
+                dir_path = os.path.join(root, dir_name)
+                self.index[os.path.relpath(dir_path, base_path).replace("\\", "/")] = dir_path
+
+        self.clips: OrderedDict[str, Animation] = OrderedDict()
+        self.lastUsed: dict[str, float] = {}
+        self.pinned = set()
+        self.bytes = 0
+
+    # the memory used by the images of an animation
+    @staticmethod
+    def animation_bytes(animation):
+        return sum(img.get_width() * img.get_height() * img.get_bytesize() for img in animation.images)
+
+    def create_animation(self, key, images):
+        if key in self.data:
+            return Animation(images, self.data[key]["img_dur"], self.data[key]["loop"])
+        return Animation(images)
+
+    def add_clip(self, key, animation):
+        self.clips[key] = animation
+        self.bytes += self.animation_bytes(animation)
+
+    def __getitem__(self, key):
+        animation = self.clips.get(key)
+        if animation is None:
+            if key not in self.index:
+                raise KeyError(key)
+            start = time.perf_counter()
+            animation = self.create_animation(key, load_images(self.index[key]))
+            self.add_clip(key, animation)
+            logger.info("Loaded animation on demand: %s (%.2fms)", key, (time.perf_counter() - start) * 1000)
+        self.clips.move_to_end(key)
+        self.lastUsed[key] = time.monotonic()
+        self.evict(key)
+        return animation
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    # the keys matching a list of keys or directory prefixes, e.g. "newPlayer" matches "newPlayer/idle/down"
+    def match(self, keys):
+        return [key for key in self.index if any(key == prefix or key.startswith(prefix + "/") for prefix in keys)]
+
+    # loads and pins the animations a level needs, decoding them on worker threads
+    def preload(self, keys):
+        keys = self.match(keys)
+        missing = [key for key in keys if key not in self.clips]
+        paths = {key: list_images(self.index[key]) for key in missing}
+        files = [path for key in missing for path in paths[key]]
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                decoded = list(executor.map(decode_image, files))
+        else:
+            decoded = [decode_image(path) for path in files]
+
+        i = 0
+        for key in missing:
+            count = len(paths[key])
+            self.add_clip(key, self.create_animation(key, [img.convert_alpha() for img, decodeTime in decoded[i:i + count]]))
+            i += count
+
+        now = time.monotonic()
+        for key in keys:
+            self.lastUsed[key] = now
+        self.pinned.update(keys)
+        logger.info("Preloaded %s animations (%s loaded)", len(keys), len(missing))
+
+    # allows animations to be unloaded again, e.g. when leaving a level
+    def unpin(self, keys=None):
+        if keys is None:
+            self.pinned.clear()
+        else:
+            self.pinned.difference_update(self.match(keys))
+
+    # unloads idle animations until under the memory budget, except the one being requested and any still being played
+    def evict(self, keep=None):
+        if self.bytes <= self.maxBytes:
+            return
+        now = time.monotonic()
+        for key in list(self.clips):
+            if self.bytes <= self.maxBytes:
+                break
+            if key == keep or key in self.pinned or self.clips[key].playing > 0 or now - self.lastUsed.get(key, 0) < self.idleTime:
+                continue
+            self.unload(key)
+
+    def unload(self, key):
+        animation = self.clips.pop(key, None)
+        if animation is not None:
+            self.bytes -= self.animation_bytes(animation)
+            self.lastUsed.pop(key, None)
+            logger.info("Unloaded animation: %s", key)
@@ -0,0 +1,61 @@
+# Modules
+import pygame
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TextureAtlas:
+    """
+    Packs many small surfaces into a few large page surfaces using shelf packing. Frames are sorted by height and laid out left to right in rows, a new page is started when a page is full, and each page is trimmed to the height it uses.
+    """
+    def __init__(self, pageSize=1024, padding=1):
+        self.pageSize = pageSize
+        self.padding = padding
+        self.pages: list[pygame.Surface] = []
+
+    # lays out the surfaces, returning (page index, rect) for each and the size of every page
+    def layout(self, surfaces):
+        placements = [None] * len(surfaces)
+        pageSizes = []
+        x = y = shelfHeight = 0
+        order = sorted(range(len(surfaces)), key=lambda i: surfaces[i].get_height(), reverse=True)
+        for i in order:
+            width, height = surfaces[i].get_size()
+            paddedWidth = width + self.padding
+            paddedHeight = height + self.padding
+
+            if not pageSizes:
+                pageSizes.append([0, 0])
+            # start a new shelf, then a new page
+            if x + width > self.pageSize and x > 0:
+                x = 0
+                y += shelfHeight
+                shelfHeight = 0
+            if y + height > self.pageSize and y > 0:
+                pageSizes.append([0, 0])
+                x = y = shelfHeight = 0
+
+            placements[i] = (len(pageSizes) - 1, pygame.Rect(x, y, width, height))
+            pageSizes[-1][0] = max(pageSizes[-1][0], x + width)
+            pageSizes[-1][1] = max(pageSizes[-1][1], y + height)
+            x += paddedWidth
+            shelfHeight = max(shelfHeight, paddedHeight)
+        return placements, pageSizes
+
+    # copies the surfaces into new pages, returning a (page, rect) region for each surface
+    def pack(self, surfaces):
+        placements, pageSizes = self.layout(surfaces)
+        pages = [pygame.Surface((max(1, width), max(1, height)), pygame.SRCALPHA) for width, height in pageSizes]
+        for surface, (page, rect) in zip(surfaces, placements):
+            # max blending onto the empty page copies the pixels and alpha exactly
+            pages[page].blit(surface, rect, special_flags=pygame.BLEND_RGBA_MAX)
+        pages = [page.convert_alpha() for page in pages]
+        self.pages.extend(pages)
+
+        logger.info("Packed %s images into %s atlas pages", len(surfaces), len(pages))
+        return [(pages[page], rect) for page, rect in placements]
+
+    # the amount of memory used by the pages
+    @property
+    def bytes(self):
+        return sum(page.get_width() * page.get_height() * page.get_bytesize() for page in self.pages)
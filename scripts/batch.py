@@ -0,0 +1,108 @@
+# Modules
+import random
+import time
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+# Scripts
+from scripts.constants import HEADLESS_RESOLUTION
+
+logger = logging.getLogger(__name__)
+
+MOVE_ACTIONS = ("moveRight", "moveLeft", "moveDown", "moveUp")
+
+@dataclass
+class InstanceConfig:
+    index: int
+    seed: int
+    ticks: int
+    scripts: list = field(default_factory=list)  # an input script for each player, see ScriptedInput
+    render: bool = False
+
+# A random input script of held movement keys, shooting and cursor moves
+def random_script(ticks, seed, changeEvery=30, resolution=HEADLESS_RESOLUTION):
+    rng = random.Random(seed)
+    script = {}
+    held = None
+    for tick in range(0, ticks, changeEvery):
+        actions = []
+        if held is not None:
+            actions.append((held, False))
+        held = rng.choice(MOVE_ACTIONS + (None,))
+        if held is not None:
+            actions.append((held, True))
+        actions.append(("shoot", rng.random() < 0.5))
+        actions.append(("cursor", (rng.randrange(resolution[0]), rng.randrange(resolution[1]))))
+        script[tick] = actions
+    return script
+
+# Runs one headless game in the current process and returns its results
+def run_instance(config: InstanceConfig):
+    # imported here so the pool workers only load pygame once they run an instance
+    from main import Game
+
+    random.seed(config.seed)
+    np.random.seed(config.seed % 2**32)
+    start = time.perf_counter()
+    game = Game(headless=True)
+    setupSeconds = time.perf_counter() - start
+    stats = game.run_headless(config.ticks, config.scripts or [random_script(config.ticks, config.seed)], render=config.render)
+
+    players = [{"id": player.id, "position": tuple(player.transform), "health": player.health} for player in game.players]
+    return {"index": config.index, "seed": config.seed, "setupSeconds": setupSeconds, "hits": game.hitResolver.hits, "players": players, **stats}
+
+class BatchRunner:
+    """
+    Runs many headless games at once across a pool of processes, one game per process at a time, so a sweep scales with the number of cores instead of being limited to one interpreter. Every instance gets its own seed and input scripts and the results of all of them are collected together.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.results = []
+
+    # creates a config for each instance with consecutive seeds
+    def make_configs(self, instances, ticks, seed=0, players=1, render=False):
+        return [InstanceConfig(i, seed + i, ticks, [random_script(ticks, (seed + i) * 31 + p) for p in range(players)], render) for i in range(instances)]
+
+    # runs every instance and returns their results in order
+    def run(self, configs):
+        start = time.perf_counter()
+        # spawned workers start from a clean interpreter instead of a copy of this process's SDL state
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            self.results = sorted(pool.map(run_instance, configs), key=lambda result: result["index"])
+        seconds = time.perf_counter() - start
+
+        summary = self.summarise(self.results, seconds)
+        logger.info("Ran %s instances on %s workers in %.2fs, %.0f ticks/s in total", summary["instances"], self.workers, seconds, summary["totalTicksPerSecond"])
+        return summary
+
+    # aggregates the ticks per second of the results
+    @staticmethod
+    def summarise(results, seconds):
+        rates = np.array([result["ticksPerSecond"] for result in results], dtype=np.float64)
+        ticks = sum(result["ticks"] for result in results)
+        return {
+            "instances": len(results),
+            "ticks": ticks,
+            "seconds": seconds,
+            "totalTicksPerSecond": ticks / seconds if seconds > 0 else 0.0,
+            "meanTicksPerSecond": float(rates.mean()) if len(rates) else 0.0,
+            "minTicksPerSecond": float(rates.min()) if len(rates) else 0.0,
+            "maxTicksPerSecond": float(rates.max()) if len(rates) else 0.0,
+            "results": results,
+        }
+
+# python -m scripts.batch [instances] [ticks] [workers]
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    args = [int(arg) for arg in sys.argv[1:]]
+    instances = args[0] if len(args) > 0 else 8
+    ticks = args[1] if len(args) > 1 else 600
+    runner = BatchRunner(args[2] if len(args) > 2 else None)
+    summary = runner.run(runner.make_configs(instances, ticks))
+    for result in summary["results"]:
+        print(f"instance {result['index']} seed {result['seed']}: {result['ticksPerSecond']:.0f} ticks/s, {result['hits']} hits")
+    print(f"{summary['ticks']} ticks in {summary['seconds']:.2f}s, {summary['totalTicksPerSecond']:.0f} ticks/s in total")
@@ -0,0 +1,167 @@
+# Modules
+import pygame
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import logging
+
+# Scripts
+from scripts.animation import Animation, load_animations, pack_animations
+from scripts.constants import BASE_IMG_PATH, BUNDLE_PATH
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_MAGIC = b"DCAB"
+BUNDLE_VERSION = 1
+HEADER_FORMAT = "<4sII"  # magic, version, header length
+
+# Lists every source file of the assets, sorted so the hashes are stable
+def source_files(base_path, data):
+    files = [data]
+    for root, dirs, names in os.walk(base_path):
+        dirs.sort()
+        for name in sorted(names):
+            files.append(os.path.join(root, name))
+    return files
+
+# A cheap signature of the sources from their paths, sizes and modification times
+def source_signature(files):
+    signature = hashlib.sha1()
+    for path in files:
+        stat = os.stat(path)
+        signature.update(f"{path.replace(os.sep, '/')}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return signature.hexdigest()
+
+# A hash of the contents of the sources
+def source_hash(files):
+    contents = hashlib.sha1()
+    for path in files:
+        contents.update(path.replace(os.sep, "/").encode())
+        with open(path, "rb") as file:
+            contents.update(file.read())
+    return contents.hexdigest()
+
+# Writes the frames of every animation as raw RGBA pixels with the animation data
+def build_bundle(assets, path=BUNDLE_PATH, base_path=BASE_IMG_PATH, data="data/animation_data.json"):
+    files = source_files(base_path, data)
+    header = {"signature": source_signature(files), "hash": source_hash(files), "animations": {}}
+    pixels = []
+    offset = 0
+    for key, animation in assets.items():
+        frames = []
+        for img in animation.images:
+            buffer = pygame.image.tobytes(img, "RGBA")
+            frames.append([offset, img.get_width(), img.get_height()])
+            pixels.append(buffer)
+            offset += len(buffer)
+        header["animations"][key] = {"img_dur": animation.img_duration, "loop": animation.loop, "frames": frames}
+
+    headerBytes = json.dumps(header).encode()
+    # written to a temporary file and swapped in, so games loading at the same time never read half a bundle
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(struct.pack(HEADER_FORMAT, BUNDLE_MAGIC, BUNDLE_VERSION, len(headerBytes)))
+        file.write(headerBytes)
+        for buffer in pixels:
+            file.write(buffer)
+    os.replace(temporary, path)
+    logger.info("Built asset bundle %s with %s animations (%s bytes of pixels)", path, len(assets), offset)
+
+# Loads the animations from a bundle, returns None if it is missing, corrupt or out of date
+def load_bundle(path=BUNDLE_PATH, base_path=BASE_IMG_PATH, data="data/animation_data.json"):
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                result = read_bundle(buffer, path, base_path, data)
+    # a bad header fails to unpack or decode and missing pixels fail in frombuffer, so the images are loaded instead
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+        logger.warning("Asset bundle %s is corrupt: %s", path, e)
+        return None
+    if result is None:
+        return None
+    assets, signature, isResigned = result
+
+    # the files were copied or touched without changing, so the new signature is stored to skip hashing next time
+    if isResigned:
+        update_signature(path, signature)
+
+    logger.info("Loaded %s animations from asset bundle %s", len(assets), path)
+    return assets
+
+# Reads the animations out of a mapped bundle, returns None if it has an unknown format or is out of date
+def read_bundle(buffer, path, base_path, data):
+    magic, version, headerLength = struct.unpack_from(HEADER_FORMAT, buffer)
+    if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+        logger.info("Asset bundle %s has an unknown format", path)
+        return None
+    start = struct.calcsize(HEADER_FORMAT)
+    header = json.loads(buffer[start:start + headerLength])
+
+    # the contents are only hashed when the file signatures differ
+    files = source_files(base_path, data)
+    signature = source_signature(files)
+    isResigned = header["signature"] != signature
+    if isResigned and header["hash"] != source_hash(files):
+        logger.info("Asset bundle %s is out of date", path)
+        return None
+
+    start += headerLength
+    assets = {}
+    # the views are released even on errors, the mapping cannot close while they exist
+    with memoryview(buffer) as view:
+        for key, animation in header["animations"].items():
+            images = []
+            for offset, width, height in animation["frames"]:
+                with view[start + offset:start + offset + width * height * 4] as frame:
+                    # converting copies the pixels out of the mapped file
+                    images.append(pygame.image.frombuffer(frame, (width, height), "RGBA").convert_alpha())
+            assets[key] = Animation(images, animation["img_dur"], animation["loop"])
+    return assets, signature, isResigned
+
+# Rewrites the source signature in the header of a bundle, keeping its pixels
+def update_signature(path, signature):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(path, "rb") as file:
+            magic, version, headerLength = struct.unpack(HEADER_FORMAT, file.read(struct.calcsize(HEADER_FORMAT)))
+            header = json.loads(file.read(headerLength))
+            header["signature"] = signature
+            headerBytes = json.dumps(header).encode()
+            with open(temporary, "wb") as output:
+                output.write(struct.pack(HEADER_FORMAT, magic, version, len(headerBytes)))
+                output.write(headerBytes)
+                shutil.copyfileobj(file, output)
+        os.replace(temporary, path)
+        logger.info("Updated the source signature of asset bundle %s", path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning("Could not update asset bundle %s: %s", path, e)
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+# Loads the animations from the bundle, falling back to the image files and rebuilding the bundle
+def load_assets(base_path=BASE_IMG_PATH, bundle=BUNDLE_PATH, data="data/animation_data.json", atlas=True, rebuild=True, workers=1):
+    assets = load_bundle(bundle, base_path, data)
+    if assets is None:
+        assets = load_animations(base_path, data, atlas=False, workers=workers)
+        if rebuild:
+            try:
+                build_bundle(assets, bundle, base_path, data)
+            except OSError as e:
+                logger.warning("Could not write asset bundle %s: %s", bundle, e)
+
+    if atlas:
+        pack_animations(assets)
+    return assets
+
+# Builds the bundle from the image files
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    pygame.display.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    build_bundle(load_animations(BASE_IMG_PATH, atlas=False))
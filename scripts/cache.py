@@ -0,0 +1,75 @@
+# Modules
+import pygame
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TransformCache:
+    """
+    A shared cache of flipped and rotated animation frames. Frames are keyed by (source frame, flipX, flipY, quantized angle) so sprites that share a frame and a similar rotation share one surface. The least recently used surfaces are evicted once the cache goes over its byte budget.
+    """
+    def __init__(self, angleResolution=1, maxBytes=32 * 1024 * 1024):
+        self.angleResolution = angleResolution
+        self.maxBytes = maxBytes
+        self.surfaces = OrderedDict()
+        self.bytes = 0
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # rounds an angle to the nearest step of the angle resolution
+    def quantize(self, angle):
+        if self.angleResolution <= 0:
+            return angle % 360
+        return (round(angle / self.angleResolution) * self.angleResolution) % 360
+
+    # the amount of memory a surface uses
+    @staticmethod
+    def surface_bytes(surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    # returns the transformed frame, creating it if it is not cached
+    def get(self, frame, flipX=False, flipY=False, angle=0):
+        angle = self.quantize(angle)
+        # untransformed frames are returned as they are
+        if not flipX and not flipY and angle == 0:
+            return frame
+
+        key = (frame, flipX, flipY, angle)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = frame
+        if flipX or flipY:
+            surface = pygame.transform.flip(surface, flipX, flipY)
+        if angle:
+            surface = pygame.transform.rotate(surface, angle)
+        surface = surface.convert_alpha()
+
+        self.surfaces[key] = surface
+        self.bytes += self.surface_bytes(surface)
+        self.evict()
+        return surface
+
+    # removes the least recently used surfaces until under budget
+    def evict(self):
+        while self.bytes > self.maxBytes and len(self.surfaces) > 1:
+            key, surface = self.surfaces.popitem(last=False)
+            self.bytes -= self.surface_bytes(surface)
+            self.evictions += 1
+
+    def clear(self):
+        self.surfaces.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+# cache shared by every entity
+TRANSFORM_CACHE = TransformCache()
@@ -2,23 +2,68 @@
 import pygame
 from pygame.constants import *
 import logging
+import bisect
+from dataclasses import dataclass
+from typing import NamedTuple
 
 # Scripts
 from scripts.menu import UserInterface, Menu, Element
+from scripts.framework import insertion_sort
 
 logger = logging.getLogger(__name__)
+
+# a sprite as it is drawn in one frame, projectiles have an id of -1
+class SpriteSnapshot(NamedTuple):
+    id: int
+    layer: int
+    image: pygame.Surface
+    position: tuple[float, float]
+
+# everything a camera needs to draw one frame, captured after the simulation so it can be drawn on another thread
+@dataclass(frozen=True)
+class CameraSnapshot:
+    screen: pygame.Surface
+    scroll: tuple[int, int]
+    scale: float
+    fill: object  # the background colour, None for transparent
+    tilemap: object
+    sprites: tuple[SpriteSnapshot, ...]
+    queue: tuple
+
+    # nothing is drawn onto the transparent screen
+    @property
+    def isEmpty(self):
+        return self.fill is None and not self.sprites and not self.queue
+
+@dataclass(frozen=True)
+class WindowSnapshot:
+    world: CameraSnapshot
+    foreground: CameraSnapshot
+    worldOffset: tuple[int, int]
+    worldOpaque: bool
+    foregroundEmpty: bool
+    uiRects: tuple
     
 class Window():
     """
     A class that manages the drawing of the window. This allows for pixel art to be easily upscaled. This class has 2 cameras. A world camera and a foreground camera. The world camera should be for entities in the world which are affected by scale. The foreground camera should be for elements like the cursor.
     """
-    def __init__(self, resolution, flags=pygame.FULLSCREEN):
+    def __init__(self, resolution, flags=pygame.FULLSCREEN, headless=False):
         self.resolution = resolution
-        self.display = pygame.display.set_mode(resolution, flags=flags)
+        self.headless = headless
+        if headless:
+            # a display mode is still needed to convert surfaces, but everything is drawn to an offscreen surface
+            pygame.display.set_mode((1, 1), pygame.HIDDEN)
+            self.display = pygame.Surface(resolution)
+        else:
+            self.display = pygame.display.set_mode(resolution, flags=flags)
 
         self.world = Camera(self.resolution, 4, (0, 0), minScale=1, maxScale=1, panStrength=10)
         self.foreground = Camera(self.resolution, 1)
         self.ui = UserInterface(self.resolution)
+
+        # the world screen is scaled into this every frame instead of a new surface
+        self.worldBuffer = pygame.Surface(self.resolution, 0, self.worldScreen)
     
     @property
     def worldScreen(self):
@@ -38,26 +83,73 @@ class Window():
     def draw_foreground(self, *args, **kwargs):
         self.foreground.draw(*args, **kwargs)
 
+    # captures both cameras, the keyword arguments are used by the world camera
+    def snapshot(self, **kwargs) -> WindowSnapshot:
+        world = self.world.snapshot(**kwargs)
+        foreground = self.foreground.snapshot()
+        offset = (int(self.world.scrollDiff.x), int(self.world.scrollDiff.y))
+        return WindowSnapshot(world, foreground, offset, self.world.isOpaque, foreground.isEmpty, tuple(self.ui.rects))
+
+    # draws a snapshot of both cameras onto the display, only touches surfaces so it can run on a render thread
+    def render(self, snapshot: WindowSnapshot):
+        self.world.render(snapshot.world)
+        self.foreground.render(snapshot.foreground)
+        self.compose(snapshot.world.screen, snapshot.foreground.screen, snapshot.worldOffset, snapshot.worldOpaque, snapshot.foregroundEmpty, snapshot.uiRects)
+
+    # redraws the changed parts of the ui and returns the changed regions
     def draw_ui(self):
-        self.ui.draw()
+        return self.ui.draw()
 
     def draw(self):
-        self.display.fill((0, 0, 0))
-        self.display.blit(pygame.transform.scale(self.worldScreen, self.resolution), self.world.scrollDiff)
-        self.display.blit(self.foregroundScreen, (0, 0))
-        self.display.blit(self.ui.screen, (0, 0))
+        offset = (int(self.world.scrollDiff.x), int(self.world.scrollDiff.y))
+        self.compose(self.worldScreen, self.foregroundScreen, offset, self.world.isOpaque, self.foreground.isEmpty, self.ui.rects)
+
+    # scales the world onto the display and draws the foreground and ui over it
+    def compose(self, worldScreen, foregroundScreen, offset, worldOpaque, foregroundEmpty, uiRects):
+        # the display only needs clearing when the world does not cover all of it
+        if not worldOpaque or offset != (0, 0):
+            self.display.fill((0, 0, 0))
+
+        pygame.transform.scale(worldScreen, self.resolution, self.worldBuffer)
+        self.display.blit(self.worldBuffer, offset)
+        if not foregroundEmpty:
+            self.display.blit(foregroundScreen, (0, 0))
+        # only the regions covered by menus are copied from the ui screen
+        for rect in uiRects:
+            self.display.blit(self.ui.screen, rect, rect)
 
 class Camera(pygame.sprite.Group):
-    def __init__(self, resolution, scale, offset=(0, 0), panStrength=20, minScale=1, maxScale=1, zoomSpeed=1):
+    def __init__(self, resolution, scale, offset=(0, 0), panStrength=20, minScale=1, maxScale=1, zoomSpeed=1, cullMargin=32):
+        # culling, scrolling sprites outside the view are not drawn
+        self.isCulling = True
+        self.cullMargin = cullMargin  # should cover rotated images and pivots
+        self.drawnCount = 0
+        self.culledCount = 0
+        # sprites kept in the order they are drawn
+        self.renderList = []
+        self.renderListOrder = "layer"
+        self.isOpaque = False
+        self.drawnEmpty = True  # nothing was drawn in the last snapshot
+        self.tilemap = None  # drawn below the sprites
+        self.projectiles = []  # projectile systems drawn with the sprites
+        self.isBatching = True  # blits every sprite in one call, turn off to blit one at a time
         super().__init__(self)
         self.resolution = resolution
         self.scale = scale
         self.offset = offset
-        self.screen = pygame.Surface((self.resolution[0] / self.scale, self.resolution[1] / self.scale), pygame.SRCALPHA | pygame.HWSURFACE)
+        # zooming draws into a viewport of one buffer instead of reallocating the screen
+        self.screenBuffer = pygame.Surface(self.scaled_size(self.scale), pygame.SRCALPHA | pygame.HWSURFACE)
+        self.viewports: dict[tuple[int, int], pygame.Surface] = {}
+        self.maxViewports = 32
+        self.screen = self.get_viewport(self.scaled_size(self.scale))
         # scroll
         self.trueScroll = pygame.math.Vector2()
         self.oldScroll = pygame.math.Vector2()
         self.scrollDiff = pygame.math.Vector2()
+        self.frameScroll = pygame.math.Vector2()  # the scroll used for the whole of a draw
+        self.previousScroll = pygame.math.Vector2()
+        # how far between the previous and current simulation step to draw, 1 draws the current state
+        self.interpolation = 1.0
         # tracking
         self.target = None  # [target, [offsetX, offsetY]]
         self.isPanning = False
@@ -78,31 +170,156 @@ class Camera(pygame.sprite.Group):
         self.scrollDiff = scroll - self.trueScroll
         return scroll
     
+    # nothing has been drawn onto the transparent screen, read from the last snapshot as taking it empties the queue
+    @property
+    def isEmpty(self):
+        return self.drawnEmpty
+
     # the rescaled screen size
     @property
     def screenSize(self):
         return self.screen.get_size()[0], self.screen.get_size()[1]
     
+    # the image of a sprite and where it is drawn on the screen
     def calculate_scroll(self, sprite):
+        # the image is read first as it can move the draw transform
+        image = sprite.image
+        transform = sprite.drawTransform
+        x, y = transform.x, transform.y
+        if self.interpolation < 1 and sprite.isInterpolated:
+            # move back towards the previous transform
+            behind = 1 - self.interpolation
+            x -= (sprite.transform.x - sprite.previousTransform.x) * behind
+            y -= (sprite.transform.y - sprite.previousTransform.y) * behind
         if sprite.isScroll:
-            self.screen.blit(sprite.image, (sprite.transform.x - self.scroll.x, sprite.transform.y - self.scroll.y))
+            return image, (x - self.frameScroll.x, y - self.frameScroll.y)
+        return image, (x, y)
+
+    # keeps the scroll and transforms before a simulation step to interpolate from
+    def store_previous(self):
+        self.previousScroll.update(self.trueScroll)
+        for sprite in self.spritedict:
+            sprite.previousTransform.update(sprite.transform)
+
+    # the snapshots of the sprites in order, projectiles are drawn after the last sprite on their layer when layered
+    def sprite_snapshots(self, sprites, layered=False):
+        snapshots = [SpriteSnapshot(id(sprite), sprite.camLayer, *self.calculate_scroll(sprite)) for sprite in sprites]
+        if self.projectiles:
+            view = self.viewRect
+            # higher layers are inserted first so the lower indices stay valid
+            for system in sorted(self.projectiles, key=lambda system: system.camLayer, reverse=True):
+                index = bisect.bisect_right(sprites, system.camLayer, key=lambda sprite: sprite.camLayer) if layered else len(snapshots)
+                snapshots[index:index] = [SpriteSnapshot(-1, system.camLayer, image, position) for image, position in system.draw_data(self.frameScroll, view, self.interpolation)]
+        return snapshots
+
+    # blits the sprites in order
+    def blit_sprites(self, sprites, layered=False):
+        self.blit_snapshots(self.screen, self.sprite_snapshots(sprites, layered))
+
+    def blit_snapshots(self, screen, snapshots):
+        blits = [(snapshot.image, snapshot.position) for snapshot in snapshots]
+        if self.isBatching:
+            fblits = getattr(screen, "fblits", None)
+            if fblits is not None:
+                fblits(blits)
+            else:
+                screen.blits(blits, doreturn=False)
         else:
-            self.screen.blit(sprite.image, (sprite.transform.x, sprite.transform.y))
+            for image, position in blits:
+                screen.blit(image, position)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.insert_render(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.renderList.remove(sprite)
+
+    # inserts a sprite into the render list, x and y orders are fixed by the next sort
+    def insert_render(self, sprite):
+        if self.renderListOrder == "layer":
+            self.renderList.insert(bisect.bisect_right(self.renderList, sprite.camLayer, key=lambda sprite: sprite.camLayer), sprite)
+        else:
+            self.renderList.append(sprite)
+
+    # called by a sprite when its camera layer changes
+    def change_sprite_layer(self, sprite):
+        if sprite in self.spritedict and self.renderListOrder == "layer":
+            self.renderList.remove(sprite)
+            self.insert_render(sprite)
+
+    # the world rect the camera can see, including the cull margin
+    @property
+    def viewRect(self):
+        scroll = self.frameScroll
+        width, height = self.screenSize
+        return pygame.Rect(scroll.x - self.cullMargin, scroll.y - self.cullMargin, width + self.cullMargin * 2, height + self.cullMargin * 2)
+
+    # returns the sprites inside the view in render order, sprites that do not scroll are always visible
+    def visible_sprites(self):
+        if not self.isCulling:
+            self.drawnCount = len(self.renderList)
+            self.culledCount = 0
+            return self.renderList
+
+        # a single pass over the render list is cheaper than keeping a spatial index of sprites that move every frame
+        view = self.viewRect
+        left, top, right, bottom = view.left, view.top, view.right, view.bottom
+        sprites = [sprite for sprite in self.renderList if not sprite.isScroll or (
+            sprite.transform.x < right and sprite.transform.x + sprite.size[0] > left and sprite.transform.y < bottom and sprite.transform.y + sprite.size[1] > top)]
+        self.drawnCount = len(sprites)
+        self.culledCount = len(self.renderList) - self.drawnCount
+        return sprites
+
+    # reorders the render list when switching between render orders
+    def sort_render_list(self, order):
+        if self.renderListOrder != order:
+            self.renderListOrder = order
+            match order:
+                case "layer":
+                    self.renderList.sort(key=lambda sprite: sprite.camLayer)
+                case "x":
+                    self.renderList.sort(key=lambda sprite: sprite.transform.x)
+                case "y":
+                    self.renderList.sort(key=lambda sprite: sprite.transform.y)
+
+    # orders sprite by layer value, the order is kept up to date as sprites are added or change layer
+    def order_by_layers(self):
+        self.sort_render_list("layer")
+        return self.visible_sprites()
+
+    # orders sprite by x value, sprites move a little each frame so the previous order is nearly sorted
+    def order_by_x(self):
+        self.sort_render_list("x")
+        insertion_sort(self.renderList, [sprite.transform.x for sprite in self.renderList])
+        return self.visible_sprites()
+    
+    # orders sprite by y value, sprites move a little each frame so the previous order is nearly sorted
+    def order_by_y(self):
+        self.sort_render_list("y")
+        insertion_sort(self.renderList, [sprite.transform.y for sprite in self.renderList])
+        return self.visible_sprites()
 
-    # orders sprite by layer value
     def draw_by_layers(self):
-        for sprite in sorted(self.sprites(), key=lambda sprite: sprite.camLayer):
-            self.calculate_scroll(sprite)
+        self.blit_sprites(self.order_by_layers(), layered=True)
 
-    # orders sprite by x value
     def draw_by_x(self):
-        for sprite in sorted(self.sprites(), key=lambda sprite: sprite.transform.x):
-            self.calculate_scroll(sprite)
-    
-    # orders sprite by y value
+        self.blit_sprites(self.order_by_x())
+
     def draw_by_y(self):
-        for sprite in sorted(self.sprites(), key=lambda sprite: sprite.transform.y):
-            self.calculate_scroll(sprite)
+        self.blit_sprites(self.order_by_y())
+
+    # the visible sprites in the current render order and whether they are ordered by layer
+    def ordered_sprites(self):
+        match self.renderOrder:
+            case {"layer": True}:
+                return self.order_by_layers(), True
+            case {"x": True}:
+                return self.order_by_x(), False
+            case {"y": True}:
+                return self.order_by_y(), False
+        return [], False
 
     def draw_line(self, colour, start, end, width=1):
         self.queue.append(("line", colour, start, end, width))
@@ -116,27 +333,29 @@ class Camera(pygame.sprite.Group):
     #         for sprite in group:
     #             self.add(sprite)
 
-    # draws the keyword arguments
-    def draw_background(self, **kwargs):
-        if "fill" in kwargs:
-            self.screen.fill(kwargs["fill"])
-        else:
-            self.screen.fill((0, 0, 0, 0))  # fill with transparency by default
-
     def draw_queue(self):
-        for item in self.queue:
+        self.render_queue(self.screen, tuple(self.queue), self.frameScroll)
+        self.queue.clear()
+
+    @staticmethod
+    def render_queue(screen, queue, scroll):
+        scroll = pygame.math.Vector2(scroll)
+        for item in queue:
             match item[0]:
                 case "line":
-                    pygame.draw.line(self.screen, item[1], item[2] - self.scroll, item[3] - self.scroll, item[4])
-                    pygame.draw.circle(self.screen, (255, 0, 0), item[2] - self.scroll, 3)
-                    pygame.draw.circle(self.screen, (0, 255, 0), item[3] - self.scroll, 3)
+                    pygame.draw.line(screen, item[1], item[2] - scroll, item[3] - scroll, item[4])
+                    pygame.draw.circle(screen, (255, 0, 0), item[2] - scroll, 3)
+                    pygame.draw.circle(screen, (0, 255, 0), item[3] - scroll, 3)
                 case "rect":
-                    rect = item[2]
-                    rect.x = rect.x - self.scroll.x
-                    rect.y = rect.y - self.scroll.y
-                    pygame.draw.rect(self.screen, item[1], rect)
+                    pygame.draw.rect(screen, item[1], pygame.Rect(item[2]).move(-scroll.x, -scroll.y))
 
-            self.queue.remove(item)
+    # sets the tilemap drawn beneath the sprites
+    def set_tilemap(self, tilemap):
+        self.tilemap = tilemap
+
+    # draws the projectiles of a projectile system
+    def add_projectiles(self, system):
+        self.projectiles.append(system)
 
     # sets a target sprite
     def set_target(self, target, offset=(0, 0)):
@@ -203,30 +422,71 @@ class Camera(pygame.sprite.Group):
         self.trueScroll.x += ((targetCenter.x - self.trueScroll.x) - self.screenSize[0] / 2) / self.panStrength
         self.trueScroll.y += ((targetCenter.y - self.trueScroll.y) - self.screenSize[1] / 2) / self.panStrength
 
+    # the size of the screen at a scale
+    def scaled_size(self, scale):
+        return int(self.resolution[0] / scale), int(self.resolution[1] / scale)
+
+    # returns a viewport into the screen buffer, the buffer only grows when a bigger size is needed
+    def get_viewport(self, size):
+        viewport = self.viewports.get(size)
+        if viewport is not None:
+            return viewport
+
+        bufferWidth, bufferHeight = self.screenBuffer.get_size()
+        if size[0] > bufferWidth or size[1] > bufferHeight:
+            self.screenBuffer = pygame.Surface((max(size[0], bufferWidth), max(size[1], bufferHeight)), pygame.SRCALPHA | pygame.HWSURFACE)
+            self.viewports.clear()
+        elif len(self.viewports) >= self.maxViewports:
+            self.viewports.pop(next(iter(self.viewports)))
+
+        viewport = self.screenBuffer.subsurface((0, 0, size[0], size[1]))
+        self.viewports[size] = viewport
+        return viewport
+
     # allows for zooming functionality
     def zoom(self, amount: float):
-        # incrementally update the desired scale
-        self.desiredScale += amount
-        # clamp the desired scale to the defined range
-        self.desiredScale = max(self.minScale, min(self.maxScale, self.desiredScale))
+        # incrementally update the desired scale, clamped to the defined range
+        desiredScale = max(self.minScale, min(self.maxScale, self.desiredScale + amount))
+        if desiredScale == self.desiredScale and self.scale == desiredScale:
+            return
+        self.desiredScale = desiredScale
         # smoothly transition the current scale towards the desired scale
         self.scale += (self.desiredScale - self.scale) * self.zoomSpeed
-        tempScreen = pygame.transform.scale(self.screen.copy(), (self.resolution[0] / self.scale, self.resolution[1] / self.scale))
-        self.screen = tempScreen
+        self.screen = self.get_viewport(self.scaled_size(self.scale))
+
+    # sets the scroll used for the whole of a frame
+    def update_frame_scroll(self):
+        if self.interpolation < 1:
+            trueScroll = self.previousScroll.lerp(self.trueScroll, self.interpolation)
+            self.frameScroll = pygame.math.Vector2(int(trueScroll.x), int(trueScroll.y))
+            self.scrollDiff = self.frameScroll - trueScroll
+        else:
+            self.frameScroll = self.scroll
+
+    # captures what the camera would draw now, sprite images are resolved here so drawing the snapshot reads no sprite state
+    def snapshot(self, **kwargs) -> CameraSnapshot:
+        self.update_frame_scroll()
+        fill = kwargs.get("fill")
+        self.isOpaque = fill is not None and pygame.Color(fill).a == 255
+        sprites, layered = self.ordered_sprites()
+        queue = tuple(self.queue)
+        self.queue.clear()
+        snapshot = CameraSnapshot(self.screen, (self.frameScroll.x, self.frameScroll.y), self.scale, fill, self.tilemap, tuple(self.sprite_snapshots(sprites, layered)), queue)
+        self.drawnEmpty = snapshot.isEmpty
+        return snapshot
+
+    # draws a snapshot onto the screen it was taken from
+    def render(self, snapshot: CameraSnapshot):
+        screen = snapshot.screen
+        screen.fill(snapshot.fill if snapshot.fill is not None else (0, 0, 0, 0))  # fill with transparency by default
+        if snapshot.tilemap is not None:
+            snapshot.tilemap.draw(screen, snapshot.scroll)
+        self.blit_snapshots(screen, snapshot.sprites)
+        self.render_queue(screen, snapshot.queue, snapshot.scroll)
 
     # handles all the drawing within the camera class
     def draw(self, **kwargs):
-        self.draw_background(**kwargs)
-        
-        match self.renderOrder:
-            case {"layer": True}:
-                self.draw_by_layers()
-            case {"x": True}:
-                self.draw_by_x
-            case {"y": True}:
-                self.draw_by_y
-
-        self.draw_queue()
+        self.render(self.snapshot(**kwargs))
 
     # handles all the updates within the camera class
     def update(self):
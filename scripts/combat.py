@@ -0,0 +1,87 @@
+# Modules
+import pygame
+import logging
+import numpy as np
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HitEvent:
+    target: object  # the entity that was hit
+    damage: float
+    owner: object  # the entity that fired the bullet
+    bullet: object = None  # the bullet sprite, None for projectiles
+    projectile: int = -1  # the index of the projectile in its system, -1 for bullet sprites
+
+class HitResolver:
+    """
+    Tests every live bullet against the hurtboxes of every damageable entity once per frame, after everything has moved. The rects are gathered into arrays and overlap tests are done with NumPy broadcasting in chunks of bullets, each bullet hits the first hurtbox it overlaps other than its owners.
+    """
+    def __init__(self, chunkSize=1024):
+        self.chunkSize = chunkSize
+        self.hits = 0
+
+    # returns the index of the first hurtbox each rect overlaps, or -1
+    def overlaps(self, rects, owners, hurtboxes):
+        first = np.full(len(rects), -1, dtype=np.int64)
+        if len(rects) == 0 or len(hurtboxes) == 0:
+            return first
+
+        hx, hy = hurtboxes[:, 0], hurtboxes[:, 1]
+        hr, hb = hx + hurtboxes[:, 2], hy + hurtboxes[:, 3]
+        targets = np.arange(len(hurtboxes))
+        for start in range(0, len(rects), self.chunkSize):
+            chunk = rects[start:start + self.chunkSize]
+            x, y = chunk[:, 0:1], chunk[:, 1:2]
+            r, b = x + chunk[:, 2:3], y + chunk[:, 3:4]
+            hit = (x < hr) & (r > hx) & (y < hb) & (b > hy)
+            hit &= owners[start:start + self.chunkSize, None] != targets
+            anyHit = hit.any(axis=1)
+            first[start:start + len(chunk)] = np.where(anyHit, hit.argmax(axis=1), -1)
+        return first
+
+    # finds the hits of bullet sprites and projectiles against damageable entities
+    def resolve(self, targets, bullets=(), projectiles=None):
+        targets = [target for target in targets if target.isDamageable]
+        if not targets:
+            return []
+        targetIndex = {target: i for i, target in enumerate(targets)}
+        hurtboxes = np.array([tuple(target.hurtbox) for target in targets], dtype=np.float64).reshape(-1, 4)
+
+        events = []
+        bullets = list(bullets)
+        if bullets:
+            rects = np.array([tuple(bullet.rect) for bullet in bullets], dtype=np.float64).reshape(-1, 4)
+            owners = np.array([targetIndex.get(bullet.owner, -1) for bullet in bullets], dtype=np.int64)
+            first = self.overlaps(rects, owners, hurtboxes)
+            for i in np.flatnonzero(first >= 0).tolist():
+                bullet = bullets[i]
+                events.append(HitEvent(targets[first[i]], bullet.damage, bullet.owner, bullet=bullet))
+
+        if projectiles is not None and len(projectiles):
+            # map projectile owners onto the target indices, the extra -1 at the end is used by projectiles without an owner
+            ownerTargets = np.array([targetIndex.get(owner, -1) for owner in projectiles.owners] + [-1], dtype=np.int64)
+            owners = ownerTargets[projectiles.ownerIds[:projectiles.count]]
+            first = self.overlaps(projectiles.rects(), owners, hurtboxes)
+            damages = projectiles.damages()
+            for i in np.flatnonzero(first >= 0).tolist():
+                ownerId = projectiles.ownerIds[i]
+                events.append(HitEvent(targets[first[i]], float(damages[i]), projectiles.owners[ownerId] if ownerId >= 0 else None, projectile=i))
+
+        self.hits += len(events)
+        return events
+
+    # damages the targets and removes the bullets that hit
+    def apply(self, events, projectiles=None):
+        removed = None
+        for event in events:
+            event.target.take_damage(event.damage, event.owner)
+            if event.bullet is not None:
+                event.bullet.expire()
+            elif projectiles is not None:
+                if removed is None:
+                    removed = np.zeros(projectiles.count, dtype=bool)
+                removed[event.projectile] = True
+        if removed is not None:
+            projectiles.remove(removed)
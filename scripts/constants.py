@@ -1,3 +1,5 @@
 import pygame
 
-BASE_IMG_PATH = "data/images/"
\ No newline at end of file
+BASE_IMG_PATH = "data/images/"
+BUNDLE_PATH = "data/assets.bundle"
+HEADLESS_RESOLUTION = (1280, 720)  # the size of the offscreen window when there is no display
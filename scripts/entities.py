@@ -7,8 +7,9 @@ from pygame.constants import *
 # Scripts
 from scripts.framework import get_center, collision_test
 from scripts.input import Controller, Keyboard
-from scripts.animation import Animation
+from scripts.animation import Animation, AnimationState, AnimationSystem
 from scripts.camera import Camera
+from scripts.cache import TRANSFORM_CACHE
 
 logger = logging.getLogger(__name__)
 
@@ -20,14 +21,20 @@ class ModifiedSpriteGroup(pygame.sprite.Group):
         return self.sprites()[index]
 
 class Entity(pygame.sprite.Sprite):
+    # flipped and rotated frames are shared between all entities
+    transformCache = TRANSFORM_CACHE
+    # advances the animations of every entity at once when set, otherwise each entity updates its own
+    animationSystem: AnimationSystem = None
+
     def __init__(self, transform:tuple[int, int], size:tuple[int, int], tag:str, assets:dict[str, Animation], camLayer=0, isScroll=True, animation="idle"):
         super().__init__()
         # parameters
         self.transform = pygame.math.Vector2(transform)
+        self.previousTransform = pygame.math.Vector2(transform)  # the transform before the last simulation step
         self.size = size
         self.tag = tag
         self.assets = assets
-        self.camLayer = camLayer
+        self._camLayer = camLayer
         self.isScroll = isScroll
         self.rotation = 0
 
@@ -36,8 +43,13 @@ class Entity(pygame.sprite.Sprite):
         self.directions: dict[str, bool] = {"left" : False, "right": False, "up": False, "down": False}
         self.movement = pygame.math.Vector2()
         self.speed = 100
+
+        # damage, entities without health can not be hit
+        self.maxHealth = None
+        self.health = None
         
         # animation
+        self.animation = None
         self.action: str = ""
         self.anim_offset: tuple[int, int] = (0, 0)
         self.anim = animation
@@ -54,15 +66,60 @@ class Entity(pygame.sprite.Sprite):
     def height(self):
         return self.size[1]
     
+    @property
+    def camLayer(self):
+        return self._camLayer
+
+    # cameras keep their render order up to date when the layer changes
+    @camLayer.setter
+    def camLayer(self, layer):
+        if layer != self._camLayer:
+            self._camLayer = layer
+            for group in self.groups():
+                if isinstance(group, Camera):
+                    group.change_sprite_layer(self)
+
     @property
     def image(self):
-        return pygame.transform.rotate(pygame.transform.flip(self.animation.img(), self.flip, False), self.rotation).convert_alpha()
+        return self.transformCache.get(self.animation.img(), self.flip, False, self.rotation)
+
+    # the position the image is drawn at
+    @property
+    def drawTransform(self):
+        return self.transform
+
+    # whether the camera can draw the entity between its previous and current transform
+    @property
+    def isInterpolated(self):
+        return True
+
+    # the rect bullets hit
+    @property
+    def hurtbox(self) -> pygame.Rect:
+        return self.rect
+
+    @property
+    def isDamageable(self):
+        return self.health is not None and self.health > 0
+
+    # removes health, returns True if the entity died
+    def take_damage(self, amount, source=None):
+        if not self.isDamageable:
+            return False
+        self.health = max(0, self.health - amount)
+        return self.health == 0
 
     # sets an animation action
     def set_action(self, action):
         if action != self.action:
             self.action = action
-            self.animation = self.assets[self.tag + "/" + self.action].copy()
+            clip = self.assets[self.tag + "/" + self.action]
+            if self.animation is not None:
+                self.animation.play(clip)
+            elif self.animationSystem is not None:
+                self.animation = self.animationSystem.create(clip)
+            else:
+                self.animation = AnimationState(clip)
 
     def calculate_direction(self) -> pygame.math.Vector2:
         direction = pygame.math.Vector2()
@@ -124,13 +181,22 @@ class PhysicsEntity(Entity):
         super().__init__(transform, size, tag, assets, layer, isScroll, animation)
         # Rects and Collisions
         self.collisions: dict[str, bool] = {'bottom': False, 'top': False, 'left': False, 'right': False}
+        self.broadphase = None  # the broadphase the entity is registered in
+
+    # Returns the tiles colliding with the entity, tiles is a list of rects, something with its own collision_test like a Broadphase or TileGrid, or a tuple of these
+    def collision_test(self, tiles):
+        if isinstance(tiles, list):
+            return collision_test(self.rect, tiles)
+        if isinstance(tiles, tuple):
+            return [tile for collider in tiles for tile in self.collision_test(collider)]
+        return tiles.collision_test(self.rect, self)
 
     # Checks for collisions based on movement direction
     def move(self, movement, tiles, dt):
         # x-axis
         self.transform.x += movement[0] * dt
         self.rect.x = self.transform.x
-        tileCollisions = collision_test(self.rect, tiles)
+        tileCollisions = self.collision_test(tiles)
         objectCollisions = {'bottom': False, 'top': False, 'left': False, 'right': False}
         for tile in tileCollisions:
             if movement[0] > 0:
@@ -144,7 +210,7 @@ class PhysicsEntity(Entity):
         # y-axis
         self.transform.y += movement[1] * dt
         self.rect.y = self.transform.y
-        tileCollisions = collision_test(self.rect, tiles)
+        tileCollisions = self.collision_test(tiles)
         for tile in tileCollisions:
             if movement[1] > 0:
                 self.rect.bottom = tile.top
@@ -155,11 +221,16 @@ class PhysicsEntity(Entity):
         self.transform.y = int(self.rect.y)
         self.collisions = objectCollisions
 
+        if self.broadphase is not None:
+            self.broadphase.move(self)
+
 class Player(PhysicsEntity):
     def __init__(self, id:int, transform:tuple[int, int], size:tuple[int, int], tag:str, assets:dict[str, Animation], layer=0, isScroll=True, animation="idle"):
         super().__init__(transform, size, tag, assets, layer, isScroll, animation)
         self.id = id
         self.speed = 100
+        self.maxHealth = 100
+        self.health = self.maxHealth
         self.weapon = None
         self.directions = {"up": False, "down": False, "left": False, "right": False}
         self.lastFacedDirection = {"up": False, "down": False, "left": False, "right": False}
@@ -171,50 +242,56 @@ class Player(PhysicsEntity):
     def event_handler(self, event, game):
         if self.input is not None:
             if isinstance(self.input, Controller):
+                self.input.handle_event(event)
                 self.controller_input(event, game)
             else:
                 self.keyboard_input(event, game)
 
+    # looks the event up in the controls of the keyboard
     def keyboard_input(self, event, game):
-        if event.type == pygame.KEYDOWN:
-            if event.key == self.input.controls.moveLeft:
+        code = event.key if event.type in (pygame.KEYDOWN, pygame.KEYUP) else getattr(event, "button", None)
+        action = self.input.actions.get((event.type, code))
+        if action is not None:
+            self.handle_action(*action, game)
+
+    # applies an action of the controls being pressed or released
+    def handle_action(self, action, pressed, game):
+        match action, pressed:
+            case "moveLeft", True:
                 self.directions["left"] = True
-            if event.key == self.input.controls.moveRight:
+            case "moveRight", True:
                 self.directions["right"] = True
-            if event.key == self.input.controls.moveUp:
+            case "moveUp", True:
                 self.directions["up"] = True
-            if event.key == self.input.controls.moveDown:
+            case "moveDown", True:
                 self.directions["down"] = True
-            if event.key == self.input.controls.reload:
+            case "reload", True:
                 if self.weapon:
                     self.weapon.reload()
 
-        elif event.type == pygame.KEYUP:
-            if event.key == self.input.controls.moveLeft:
+            case "moveLeft", False:
                 self.directions["left"] = False
                 self.lastFacedDirection = {"up": self.directions["up"], "down": self.directions["down"], "left": True, "right": False}
-            if event.key == self.input.controls.moveRight:
+            case "moveRight", False:
                 self.directions["right"] = False
                 self.lastFacedDirection = {"up": self.directions["up"], "down": self.directions["down"], "left": False, "right": True}
-            if event.key == self.input.controls.moveUp:
+            case "moveUp", False:
                 self.directions["up"] = False
                 self.lastFacedDirection = {"up": True, "down": False, "left": self.directions["left"], "right": self.directions["right"]}
-            if event.key == self.input.controls.moveDown:
+            case "moveDown", False:
                 self.directions["down"] = False
                 self.lastFacedDirection = {"up": False, "down": True, "left": self.directions["left"], "right": self.directions["right"]}
 
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == self.input.controls.shoot:
+            case "shoot", True:
                 if self.weapon:
                     if self.weapon.isAutomatic:
                         self.weapon.shooting = True
                     else:
                         self.weapon.shoot(game)
-
-        if event.type == pygame.MOUSEBUTTONUP:
-            if self.weapon:
-                if self.weapon.isAutomatic:
-                    self.weapon.shooting = False
+            case "shoot", False:
+                if self.weapon:
+                    if self.weapon.isAutomatic:
+                        self.weapon.shooting = False
 
     def controller_input(self, event, game):
         if self.input.leftStick.x > 0:
@@ -241,10 +318,6 @@ class Player(PhysicsEntity):
             self.directions["down"] = False
             self.directions["up"] = False
 
-        if self.input.rightTrigger.down:
-            if self.weapon:
-                self.weapon.shoot(game)
-
     def update_animation_state(self):
         if any(self.directions.values()):  # If any direction is True, player is moving
             if self.directions["up"]:
@@ -308,10 +381,15 @@ class Player(PhysicsEntity):
 
         self.move(self.movement, tiles, dt)
         self.update_animation_state()
-        self.update_animation(dt)
+        if not self.animation.isBatched:
+            self.update_animation(dt)
 
         if self.cursor:
             self.cursor.update(self, camera, dt)
+        # the trigger is checked once per update so a press shoots once however many events it took
+        if isinstance(self.input, Controller) and self.input.rightTrigger.down:
+            if self.weapon:
+                self.weapon.shoot(game)
         if self.input:
             self.input.update()
         if self.weapon:
@@ -347,11 +425,12 @@ class UserCursor(Entity):
             self.transform.y = y
             self.set_transform(x, y)
         else:
-            x, y = pygame.mouse.get_pos()
+            x, y = player.input.get_cursor() if player.input else pygame.mouse.get_pos()
             self.set_transform(x, y)
 
         self.cursor_in_space(camera.scale)
-        self.update_animation(dt)
+        if not self.animation.isBatched:
+            self.update_animation(dt)
 
     def cursor_in_space(self, camera_scale):
         self.location.x = self.transform.x // camera_scale
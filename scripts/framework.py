@@ -67,6 +67,19 @@ def collision_test(object_1,object_list):
             collision_list.append(obj)
     return collision_list
 
+# Sorts items in place by precomputed keys, fast when the items are almost sorted already
+def insertion_sort(items, keys):
+    for i in range(1, len(items)):
+        item = items[i]
+        key = keys[i]
+        j = i - 1
+        while j >= 0 and keys[j] > key:
+            items[j + 1] = items[j]
+            keys[j + 1] = keys[j]
+            j -= 1
+        items[j + 1] = item
+        keys[j + 1] = key
+
 # Sets an objects position to another position
 def setPos(object, pos):
     object.pos[0] = pos[0]
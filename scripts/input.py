@@ -1,7 +1,7 @@
 # Modules
 import pygame
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
 # Scripts
 
@@ -10,6 +10,7 @@ logger = logging.getLogger(__name__)
 
 TRIGGER_UP = pygame.USEREVENT + 1
 TRIGGER_DOWN = pygame.USEREVENT + 2
+JOYSTICK_EVENTS = (pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYHATMOTION)
 
 @dataclass
 class Controls:
@@ -26,93 +27,253 @@ class Trigger:
     def __init__(self, axis):
         self.axis = axis
         self.number = -1
-        self.down = False
-        self.up = False
+        self.down = False  # pressed since the edges were last cleared
+        self.up = False  # released since the edges were last cleared
         self.activated = False
         self.stop = 0
 
-    def get_trigger(self, joystick):
-        self.number = joystick.get_axis(self.axis)
-        
+    # sets the value of the trigger from an axis event, the edges stay set until they are cleared
+    def set_value(self, number):
+        self.number = number
+
         # Check if the trigger is pressed beyond the stop threshold
-        if self.number > self.stop:
+        if number > self.stop:
             if not self.activated:
                 self.down = True
-            else:
-                self.down = False
             self.activated = True
-            self.up = False
-        elif self.number < self.stop:
+        elif number < self.stop:
             if self.activated:
                 self.up = True
-                self.activated = False
-            else:
-                self.up = False
-            self.down = False
-        else:
-            self.down = False
-            self.up = False
+            self.activated = False
+
+    def get_trigger(self, joystick):
+        self.set_value(joystick.get_axis(self.axis))
+
+    def clear_edges(self):
+        self.down = False
+        self.up = False
 
 class Controller:
+    """
+    Keeps the state of a joystick up to date from its events instead of polling it every frame. Axis events update the stick or trigger they belong to, with the deadzone only applied when a value changes, and button events keep the held buttons along with the buttons pressed and released since the edges were last cleared at the end of the player's update.
+    """
+    leftStickAxes = (0, 1)
+    rightStickAxes = (2, 3)
+
     def __init__(self, controls:Controls, joystick):
         # parameters
         self.controls = controls
         self.joystick = joystick
         self.guid = joystick.get_guid()
         self.name = joystick.get_name()
+        self.instanceId = joystick.get_instance_id()  # identifies the joystick in its events
         
         # controller sticks
         self.leftStick = pygame.math.Vector2()
         self.rightStick = pygame.math.Vector2()
         self.leftTrigger = Trigger(4)
         self.rightTrigger = Trigger(5)
+        self.axes = [0.0] * joystick.get_numaxes()  # the raw values of the axes
+
+        # buttons
+        self.buttons: set[int] = set()  # held buttons
+        self.pressed: set[int] = set()  # buttons pressed since the edges were last cleared
+        self.released: set[int] = set()
 
         # attributes
         self.deadzone = 0.1
+        self.isRadialDeadzone = True  # the deadzone is a circle around the centre of the stick instead of each axis on its own
         self.triggerStop = 0
         self.triggerActivated = False
+        self.sync()
 
     # reassigns the joystick to the controller
     def reassign_joystick(self, joystick):
         self.joystick = joystick
         self.guid = joystick.get_guid()
         self.name = joystick.get_name()
+        self.instanceId = joystick.get_instance_id()
+        self.axes = [0.0] * joystick.get_numaxes()
+        self.sync()
+
+    # every event of the joystick goes to its player as a whole, with no action
+    def action_map(self):
+        return {(eventType, self.instanceId): (None, None) for eventType in JOYSTICK_EVENTS}
+
+    # reads the whole state of the joystick once, events keep it up to date after
+    def sync(self):
+        for axis in range(len(self.axes)):
+            self.set_axis(axis, self.joystick.get_axis(axis))
+        self.buttons = {button for button in range(self.joystick.get_numbuttons()) if self.joystick.get_button(button)}
+        self.clear_edges()
+
+    # updates the state from an event of this controller's joystick
+    def handle_event(self, event):
+        if event.type == pygame.JOYAXISMOTION:
+            self.set_axis(event.axis, event.value)
+        elif event.type == pygame.JOYBUTTONDOWN:
+            self.buttons.add(event.button)
+            self.pressed.add(event.button)
+        elif event.type == pygame.JOYBUTTONUP:
+            self.buttons.discard(event.button)
+            self.released.add(event.button)
+
+    # stores an axis value and recalculates the stick or trigger it belongs to
+    def set_axis(self, axis, value):
+        if axis >= len(self.axes):
+            self.axes.extend([0.0] * (axis + 1 - len(self.axes)))
+        if self.axes[axis] == value:
+            return
+        self.axes[axis] = value
+
+        if axis in self.leftStickAxes:
+            self.control_deadzone(self.leftStick, self.axes[self.leftStickAxes[0]], self.axes[self.leftStickAxes[1]])
+        elif axis in self.rightStickAxes:
+            self.control_deadzone(self.rightStick, self.axes[self.rightStickAxes[0]], self.axes[self.rightStickAxes[1]])
+        elif axis == self.leftTrigger.axis:
+            self.leftTrigger.set_value(value)
+        elif axis == self.rightTrigger.axis:
+            self.rightTrigger.set_value(value)
 
     # controls the deadzone - input below deadzone value is set to 0 to stop stick drift
-    def control_deadzone(self, deadzone, *axes):
-        newAxes = []
-        for axis in axes:
-            if abs(axis) < deadzone:
-                axis = 0
-            newAxes.append(axis)
-
-        return newAxes
-
-    # calculate sticks movement with deadzone
-    def calculate_sticks(self):
-        leftStick = self.control_deadzone(self.deadzone, self.joystick.get_axis(0), self.joystick.get_axis(1))
-        rightStick = self.control_deadzone(self.deadzone, self.joystick.get_axis(2), self.joystick.get_axis(3))
-        self.leftStick.x = leftStick[0]
-        self.leftStick.y = leftStick[1]
-        self.rightStick.x = rightStick[0]
-        self.rightStick.y = rightStick[1]
-
-    def calculate_triggers(self):
-        self.leftTrigger.get_trigger(self.joystick)
-        self.rightTrigger.get_trigger(self.joystick)
-
-    # update the sticks
+    def control_deadzone(self, stick, x, y):
+        deadzone = self.deadzone
+        if self.isRadialDeadzone:
+            # the length past the deadzone is rescaled so the stick still reaches full speed
+            length = (x * x + y * y) ** 0.5
+            if length == 0 or length <= deadzone:
+                stick.update(0, 0)
+            else:
+                scale = min(1.0, (length - deadzone) / (1 - deadzone)) / length
+                stick.update(x * scale, y * scale)
+        else:
+            stick.update(0 if abs(x) < deadzone else x, 0 if abs(y) < deadzone else y)
+
+    def is_held(self, button):
+        return button in self.buttons
+
+    def was_pressed(self, button):
+        return button in self.pressed
+
+    def was_released(self, button):
+        return button in self.released
+
+    # forgets the presses and releases handled this frame
+    def clear_edges(self):
+        self.pressed.clear()
+        self.released.clear()
+        self.leftTrigger.clear_edges()
+        self.rightTrigger.clear_edges()
+
+    # called at the end of the player's update, the state itself is kept up to date by events
     def update(self):
-        self.calculate_sticks()
-        self.calculate_triggers()    
+        self.clear_edges()
+
 class Keyboard:
+    mouseActions = ("shoot",)  # controls that are mouse buttons instead of keys
+
     def __init__(self, controls:Controls):
         self.controls = controls
         self.name = "keyboard"
+        self.actions = self.action_map()
+
+    # changes the controls and recompiles their actions, the game's input router needs recompiling after
+    def set_controls(self, controls:Controls):
+        self.controls = controls
+        self.actions = self.action_map()
+
+    # maps (event type, key or button) to (action, pressed) for each of the controls
+    def action_map(self):
+        table = {}
+        for field in fields(self.controls):
+            code = getattr(self.controls, field.name)
+            if field.name in self.mouseActions:
+                table[(pygame.MOUSEBUTTONDOWN, code)] = (field.name, True)
+                table[(pygame.MOUSEBUTTONUP, code)] = (field.name, False)
+            else:
+                table[(pygame.KEYDOWN, code)] = (field.name, True)
+                table[(pygame.KEYUP, code)] = (field.name, False)
+        return table
+
+    # the position of the cursor on the screen
+    def get_cursor(self):
+        return pygame.mouse.get_pos()
 
     def update(self):
         pass
 
+class ScriptedInput(Keyboard):
+    """
+    A keyboard that plays back a script instead of reading real input, used to drive players when the game runs headless. The script maps ticks to a list of (action, value) pairs, where the action is a field of the controls with True for pressed and False for released, or "cursor" with a screen position. The actions are turned into the same key and mouse events a real keyboard would post.
+    """
+    def __init__(self, controls:Controls, script:dict[int, list[tuple]]=None):
+        super().__init__(controls)
+        self.name = "scripted"
+        self.script = script if script is not None else {}
+        self.cursor = (0, 0)
+
+    def get_cursor(self):
+        return self.cursor
+
+    # the events of the actions scripted for a tick
+    def get_events(self, tick):
+        events = []
+        for action, value in self.script.get(tick, ()):
+            if action == "cursor":
+                self.cursor = tuple(value)
+            elif action in self.mouseActions:
+                eventType = pygame.MOUSEBUTTONDOWN if value else pygame.MOUSEBUTTONUP
+                events.append(pygame.event.Event(eventType, button=getattr(self.controls, action), pos=self.cursor))
+            else:
+                eventType = pygame.KEYDOWN if value else pygame.KEYUP
+                events.append(pygame.event.Event(eventType, key=getattr(self.controls, action)))
+        return events
+
+class InputRouter:
+    """
+    Sends each event only to the players it affects. The controls of every player's input device are compiled into one table from (event type, key, button or joystick instance id) to the (player, action, pressed) routes for it, so routing an event is a single lookup instead of asking every player about every event. The table is recompiled whenever players or their devices change.
+    """
+    # the attribute of each event type that identifies what it came from
+    eventCodes = {
+        pygame.KEYDOWN: "key",
+        pygame.KEYUP: "key",
+        pygame.MOUSEBUTTONDOWN: "button",
+        pygame.MOUSEBUTTONUP: "button",
+        pygame.JOYAXISMOTION: "instance_id",
+        pygame.JOYBUTTONDOWN: "instance_id",
+        pygame.JOYBUTTONUP: "instance_id",
+        pygame.JOYHATMOTION: "instance_id",
+    }
+
+    def __init__(self):
+        self.routes: dict[tuple[int, int], tuple] = {}
+
+    # builds the routing table from the input devices of the players, scripted devices feed their player directly
+    def compile(self, players):
+        routes = {}
+        for player in players:
+            if player.input is None or isinstance(player.input, ScriptedInput):
+                continue
+            for key, (action, pressed) in player.input.action_map().items():
+                routes.setdefault(key, []).append((player, action, pressed))
+        self.routes = {key: tuple(targets) for key, targets in routes.items()}
+        logger.info("Compiled %s input routes for %s players", len(self.routes), len(players))
+
+    # the routes of an event, empty when no player uses it
+    def lookup(self, event):
+        code = self.eventCodes.get(event.type)
+        if code is None:
+            return ()
+        return self.routes.get((event.type, getattr(event, code, None)), ())
+
+    # sends an event to the players it is routed to
+    def route(self, event, game):
+        for player, action, pressed in self.lookup(event):
+            if action is None:
+                player.event_handler(event, game)
+            else:
+                player.handle_action(action, pressed, game)
+
 # Checks for controllers and initialises them
 def controller_check():
     joysticks = []
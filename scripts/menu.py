@@ -5,8 +5,13 @@ import logging
 logger = logging.getLogger(__name__)
 
 class UserInterface:
+    """
+    Retained mode UI. Menus keep their composed surface and only redraw when one of their elements changes, and the UI screen is only redrawn in the regions of menus that changed, moved, appeared or disappeared.
+    """
     def __init__(self, resolution):
         self.menus = {}
+        self.orderedMenus = []
+        self.removedRects = []
         self.screen = pygame.Surface(resolution, pygame.SRCALPHA | pygame.HWSURFACE)
 
     def update(self):
@@ -17,17 +22,54 @@ class UserInterface:
         for menu in self.menus.values():
             menu.event_handler(event)
 
+    # redraws the changed regions of the screen and returns them
     def draw(self):
-        self.screen.fill((0, 0, 0, 0))  # Clear the screen with transparency
-        for menu in sorted(self.menus.values(), key=lambda menu: menu.uiLayer):
-            if menu.visible:
-                menu.draw(self.screen)
+        dirtyRects = self.removedRects
+        self.removedRects = []
+        for menu in self.orderedMenus:
+            rect = menu.rect if menu.visible else None
+            if rect != menu.drawnRect or (rect and menu.dirty):
+                if menu.drawnRect:
+                    dirtyRects.append(menu.drawnRect)
+                if rect and rect != menu.drawnRect:
+                    dirtyRects.append(rect)
+            if rect and menu.dirty:
+                menu.compose()
+            menu.drawnRect = rect
+
+        for rect in dirtyRects:
+            self.screen.set_clip(rect)
+            self.screen.fill((0, 0, 0, 0))  # Clear the region with transparency
+            for menu in self.orderedMenus:
+                if menu.visible and menu.rect.colliderect(rect):
+                    self.screen.blit(menu.surface, menu.transform)
+        self.screen.set_clip(None)
+        return dirtyRects
+
+    # the regions of the screen covered by visible menus
+    @property
+    def rects(self):
+        return [menu.drawnRect for menu in self.orderedMenus if menu.drawnRect]
+
+    # no menus are drawn
+    @property
+    def isEmpty(self):
+        return not any(menu.visible for menu in self.menus.values())
+
+    def sort_menus(self):
+        self.orderedMenus = sorted(self.menus.values(), key=lambda menu: menu.uiLayer)
 
     def add_menu(self, child):
         self.menus[child.name] = child
+        child.drawnRect = None
+        self.sort_menus()
 
     def remove_menu(self, childName):
-        self.menus.pop(childName, None)
+        menu = self.menus.pop(childName, None)
+        if menu and menu.drawnRect:
+            # the region is cleared on the next draw
+            self.removedRects.append(menu.drawnRect)
+        self.sort_menus()
 
 class Menu:
     def __init__(self, name, transform, size, uiLayer=1):
@@ -35,43 +77,104 @@ class Menu:
         self.transform = pygame.math.Vector2(transform)
         self.size = size
         self.children = {}
+        self.orderedChildren = []
         self.surface = pygame.Surface(size, pygame.SRCALPHA | pygame.HWSURFACE)
         self.uiLayer = uiLayer
         self.active = False
         self.visible = True
+        # the surface is recomposed when dirty
+        self.dirty = True
+        self.drawnRect = None
 
-    def draw(self, screen):
+    @property
+    def rect(self):
+        return pygame.Rect(self.transform, self.size)
+
+    # redraws the children onto the menus surface
+    def compose(self):
         self.surface.fill((0, 0, 0, 0))  # Clear the surface with transparency
-        for child in sorted(self.children.values(), key=lambda child: child.uiLayer):
-            self.surface.blit(child.image, child.globalTransform(self.transform))
+        for child in self.orderedChildren:
+            self.surface.blit(child.image, child.transform)
+            child.dirty = False
+        self.dirty = False
+
+    def draw(self, screen):
+        if self.dirty:
+            self.compose()
         screen.blit(self.surface, self.transform)
 
     def update(self):
-        for child in self.children.values():
+        for child in self.orderedChildren:
             child.update()
 
     def event_handler(self, event):
         for child in self.children.values():
             child.event_handler(event)
 
+    def sort_children(self):
+        self.orderedChildren = sorted(self.children.values(), key=lambda child: child.uiLayer)
+        self.dirty = True
+
     def add_child(self, child):
         self.children[child.name] = child
+        child.menu = self
+        self.sort_children()
 
     def remove_child(self, childName):
-        self.children.pop(childName, None)
+        child = self.children.pop(childName, None)
+        if child:
+            child.menu = None
+        self.sort_children()
 
 class Element(pygame.sprite.Sprite):
     def __init__(self, name, transform, image, text=None, uiLayer=1):
         super().__init__()
+        self.menu = None
+        self.dirty = True
         self.name = name
         self.transform = pygame.math.Vector2(transform)
-        self.image = image
+        self._image = image
         self.text = text
         self.rect = self.image.get_rect(topleft=self.transform)
-        self.uiLayer = uiLayer
+        self._uiLayer = uiLayer
+
+    @property
+    def image(self):
+        return self._image
+
+    @image.setter
+    def image(self, image):
+        self._image = image
+        self.mark_dirty()
+
+    @property
+    def uiLayer(self):
+        return self._uiLayer
+
+    @uiLayer.setter
+    def uiLayer(self, uiLayer):
+        self._uiLayer = uiLayer
+        if self.menu:
+            self.menu.sort_children()
+
+    # flags the element and its menu to be redrawn
+    def mark_dirty(self):
+        self.dirty = True
+        if self.menu:
+            self.menu.dirty = True
+
+    def set_transform(self, transform):
+        self.transform = pygame.math.Vector2(transform)
+        self.mark_dirty()
 
     def update(self):
-        self.rect.x, self.rect.y = self.transform.x, self.transform.y
+        # the transform may have been changed in place
+        if self.rect.topleft != (int(self.transform.x), int(self.transform.y)):
+            self.rect.x, self.rect.y = self.transform.x, self.transform.y
+            self.mark_dirty()
+        if self.rect.size != self.image.get_size():
+            self.rect.size = self.image.get_size()
+            self.mark_dirty()
 
     def globalTransform(self, menuTransform):
         return self.transform + menuTransform
@@ -80,43 +183,44 @@ class Element(pygame.sprite.Sprite):
         pass
 
 # Example usage:
-pygame.init()
-resolution = (800, 600)
-ui = UserInterface(resolution)
-
-window = pygame.display.set_mode(resolution)
-
-menu = Menu('main_menu', (50, 50), (700, 500))
-
-button_image = pygame.Surface((200, 50))
-button_image.fill((255, 0, 0))
-button = Element('button', (100, 100), button_image, "Button")
-
-button_image2 = pygame.Surface((200, 100))
-button_image2.fill((0, 255, 0))
-button2 = Element('button2', (200, 150), button_image2, "Button2")
-
-button_image3 = pygame.Surface((100, 200))
-button_image3.fill((0, 0, 255))
-button3 = Element('button3', (300, 200), button_image3, "Button3")
-
-menu.add_child(button)
-menu.add_child(button2)
-menu.add_child(button3)
-ui.add_menu(menu)
-
-# Main loop
-running = True
-while running:
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            running = False
-        ui.event_handler(event)
+if __name__ == "__main__":
+    pygame.init()
+    resolution = (800, 600)
+    ui = UserInterface(resolution)
+
+    window = pygame.display.set_mode(resolution)
+
+    menu = Menu('main_menu', (50, 50), (700, 500))
+
+    button_image = pygame.Surface((200, 50))
+    button_image.fill((255, 0, 0))
+    button = Element('button', (100, 100), button_image, "Button")
+
+    button_image2 = pygame.Surface((200, 100))
+    button_image2.fill((0, 255, 0))
+    button2 = Element('button2', (200, 150), button_image2, "Button2")
+
+    button_image3 = pygame.Surface((100, 200))
+    button_image3.fill((0, 0, 255))
+    button3 = Element('button3', (300, 200), button_image3, "Button3")
+
+    menu.add_child(button)
+    menu.add_child(button2)
+    menu.add_child(button3)
+    ui.add_menu(menu)
+
+    # Main loop
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                running = False
+            ui.event_handler(event)
     
-    window.fill((100, 100, 100))
-    ui.update()
-    ui.draw()
-    window.blit(ui.screen, (0, 0))
-    pygame.display.flip()
+        window.fill((100, 100, 100))
+        ui.update()
+        ui.draw()
+        window.blit(ui.screen, (0, 0))
+        pygame.display.flip()
 
-pygame.quit()
+    pygame.quit()
@@ -0,0 +1,179 @@
+# Modules
+import pygame
+import math
+import logging
+import numpy as np
+from dataclasses import dataclass
+
+# Scripts
+from scripts.animation import Animation
+from scripts.cache import TRANSFORM_CACHE
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ProjectileType:
+    clip: Animation
+    size: tuple[int, int]
+    speed: float
+    lifetime: float
+    damage: float
+
+class ProjectileSystem:
+    """
+    Stores projectiles as arrays of positions, velocities, rotations, lifetimes and types instead of sprites, so every projectile is moved, aged and removed with a few vectorized operations per frame. Cameras draw the visible projectiles through draw_data.
+    """
+    def __init__(self, capacity=1024, camLayer=1):
+        self.camLayer = camLayer
+        self.transformCache = TRANSFORM_CACHE
+        self.count = 0
+        self.capacity = 0
+        self.positions = np.zeros((0, 2), dtype=np.float64)
+        self.previousPositions = np.zeros((0, 2), dtype=np.float64)  # the positions before the last simulation step
+        self.velocities = np.zeros((0, 2), dtype=np.float64)
+        self.rotations = np.zeros(0, dtype=np.float64)
+        self.lifetimes = np.zeros(0, dtype=np.float64)
+        self.ages = np.zeros(0, dtype=np.float64)
+        self.typeIds = np.zeros(0, dtype=np.int32)
+        self.ownerIds = np.zeros(0, dtype=np.int32)  # index into owners, -1 for none
+        self.grow(capacity)
+
+        # entities that fired projectiles
+        self.owners: list[object] = []
+        self.ownerIndex: dict[object, int] = {}
+
+        # projectile types, created from the bullets weapons fire
+        self.types: list[ProjectileType] = []
+        self.typeIndex: dict[object, int] = {}
+
+    def grow(self, capacity):
+        extra = capacity - self.capacity
+        self.positions = np.concatenate((self.positions, np.zeros((extra, 2))))
+        self.previousPositions = np.concatenate((self.previousPositions, np.zeros((extra, 2))))
+        self.velocities = np.concatenate((self.velocities, np.zeros((extra, 2))))
+        self.rotations = np.concatenate((self.rotations, np.zeros(extra)))
+        self.lifetimes = np.concatenate((self.lifetimes, np.zeros(extra)))
+        self.ages = np.concatenate((self.ages, np.zeros(extra)))
+        self.typeIds = np.concatenate((self.typeIds, np.zeros(extra, dtype=np.int32)))
+        self.ownerIds = np.concatenate((self.ownerIds, np.full(extra, -1, dtype=np.int32)))
+        self.capacity = capacity
+
+    # returns the type id of a template bullet, registering it the first time
+    def get_type(self, bullet):
+        typeId = self.typeIndex.get(bullet)
+        if typeId is None:
+            typeId = len(self.types)
+            self.types.append(ProjectileType(bullet.animation.clip, tuple(bullet.size), bullet.speed, bullet.timeAlive, bullet.damage))
+            self.typeIndex[bullet] = typeId
+        return typeId
+
+    # returns the owner id of an entity, registering it the first time
+    def get_owner(self, owner):
+        if owner is None:
+            return -1
+        ownerId = self.ownerIndex.get(owner)
+        if ownerId is None:
+            ownerId = len(self.owners)
+            self.owners.append(owner)
+            self.ownerIndex[owner] = ownerId
+        return ownerId
+
+    # adds a projectile travelling in the direction of its rotation
+    def spawn(self, typeId, transform, rotation, owner=None):
+        if self.count == self.capacity:
+            self.grow(self.capacity * 2)
+        projectileType = self.types[typeId]
+        i = self.count
+        self.positions[i] = transform[0], transform[1]
+        self.previousPositions[i] = transform[0], transform[1]
+        self.velocities[i] = math.cos(math.radians(rotation)) * projectileType.speed, -math.sin(math.radians(rotation)) * projectileType.speed
+        self.rotations[i] = rotation
+        self.lifetimes[i] = projectileType.lifetime
+        self.ages[i] = 0
+        self.typeIds[i] = typeId
+        self.ownerIds[i] = self.get_owner(owner)
+        self.count += 1
+        return i
+
+    # moves and ages every projectile, then removes the expired ones
+    def update(self, dt):
+        n = self.count
+        if n == 0:
+            return
+        self.positions[:n] += self.velocities[:n] * dt
+        self.lifetimes[:n] -= dt
+        self.ages[:n] += dt
+        self.remove(self.lifetimes[:n] < 0)
+
+    # removes the projectiles where the mask is True, moving the rest to the front
+    def remove(self, mask):
+        if not mask.any():
+            return
+        keep = np.flatnonzero(~mask)
+        count = len(keep)
+        for array in (self.positions, self.previousPositions, self.velocities, self.rotations, self.lifetimes, self.ages, self.typeIds, self.ownerIds):
+            array[:count] = array[keep]
+        self.count = count
+        self.compact_owners()
+
+    # forgets the owners no live projectile was fired by, so dead entities are not kept alive
+    def compact_owners(self):
+        if not self.owners:
+            return
+        ownerIds = self.ownerIds[:self.count]
+        used = np.bincount(ownerIds[ownerIds >= 0], minlength=len(self.owners)) > 0
+        if used.all():
+            return
+        kept = np.flatnonzero(used)
+        # old id -> new id, with the extra -1 at the end used by projectiles without an owner
+        remap = np.full(len(self.owners) + 1, -1, dtype=np.int32)
+        remap[kept] = np.arange(len(kept), dtype=np.int32)
+        self.ownerIds[:self.count] = remap[ownerIds]
+        self.owners = [self.owners[i] for i in kept.tolist()]
+        self.ownerIndex = {owner: i for i, owner in enumerate(self.owners)}
+
+    # the rects of every projectile as an (n, 4) array
+    def rects(self):
+        n = self.count
+        sizes = np.array([projectileType.size for projectileType in self.types], dtype=np.float64).reshape(-1, 2)
+        return np.concatenate((self.positions[:n], sizes[self.typeIds[:n]]), axis=1)
+
+    # the damage of every projectile
+    def damages(self):
+        damages = np.array([projectileType.damage for projectileType in self.types], dtype=np.float64)
+        return damages[self.typeIds[:self.count]]
+
+    # keeps the positions before a simulation step to interpolate from
+    def store_previous(self):
+        self.previousPositions[:self.count] = self.positions[:self.count]
+
+    def clear(self):
+        self.count = 0
+        self.owners.clear()
+        self.ownerIndex.clear()
+
+    # the (image, position) of every projectile inside a world rect, relative to the scroll, interpolated between the previous and current positions
+    def draw_data(self, scroll, view=None, interpolation=1.0):
+        n = self.count
+        if n == 0:
+            return []
+        positions = self.positions[:n]
+        if interpolation < 1:
+            positions = self.previousPositions[:n] + (positions - self.previousPositions[:n]) * interpolation
+        indices = np.arange(n)
+        if view is not None:
+            inside = (positions[:, 0] >= view[0]) & (positions[:, 0] < view[0] + view[2]) & (positions[:, 1] >= view[1]) & (positions[:, 1] < view[1] + view[3])
+            indices = np.flatnonzero(inside)
+
+        blits = []
+        get = self.transformCache.get
+        types = self.types
+        for x, y, rotation, age, typeId in zip(positions[indices, 0].tolist(), positions[indices, 1].tolist(), self.rotations[indices].tolist(), self.ages[indices].tolist(), self.typeIds[indices].tolist()):
+            clip = types[typeId].clip
+            frame = int(age / clip.img_duration)
+            frame = frame % len(clip.images) if clip.loop else min(frame, len(clip.images) - 1)
+            blits.append((get(clip.images[frame], False, False, rotation), (x - scroll[0], y - scroll[1])))
+        return blits
+
+    def __len__(self):
+        return self.count
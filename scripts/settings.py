@@ -1,6 +1,7 @@
 # Modules
 import pygame
 import pickle
+import os
 from pygame.constants import *
 import logging
 
@@ -10,9 +11,20 @@ from scripts.input import Controls
 logger = logging.getLogger(__name__)
 
 class Settings:
-    def __init__(self):
-        self.resolution = (pygame.display.Info().current_w, pygame.display.Info().current_h)
-        self.targetFPS = 120
+    def __init__(self, resolution=None):
+        # the resolution of the display is only queried when one is not given, so settings can be made without a display
+        if resolution is None:
+            info = pygame.display.Info()
+            resolution = (info.current_w, info.current_h)
+        self.resolution = tuple(resolution)
+        self.targetFPS = 120  # frames are capped to this, 0 is uncapped
+        self.fixedTimestep = True  # simulates in fixed steps and interpolates between them when drawing
+        self.simulationRate = 60  # steps per second
+        self.maxSimulationSteps = 5  # steps per frame before the simulation falls behind
+        self.loadWorkers = os.cpu_count() or 1  # threads used to decode images
+        self.lazyAssets = False  # loads animations when they are first used instead of at startup
+        self.projectileSystem = False  # stores bullets in arrays instead of as sprites
+        self.pipelinedRendering = False  # draws the last frame on a render thread while the next one is simulated
         self.keyboard = Controls(K_d, K_a, K_s, K_w, K_LSHIFT, K_ESCAPE, 1, K_r)
         self.controller = Controls(0, 0, 1, 1, 1, 7, 100, 3)
 
@@ -0,0 +1,123 @@
+# Modules
+import pygame
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SpatialHash:
+    """
+    A uniform grid that buckets items by the cells their rect overlaps. Items are only moved between cells when the range of cells they overlap changes, so updating an item that stays within its cells is cheap.
+    """
+    def __init__(self, cellSize=64):
+        self.cellSize = cellSize
+        self.cells: dict[tuple[int, int], set] = {}
+        self.items: dict[object, tuple[int, int, int, int]] = {}
+
+    # the range of cells a rect overlaps
+    def cell_range(self, rect):
+        size = self.cellSize
+        return (int(rect[0] // size), int(rect[1] // size), int((rect[0] + rect[2]) // size), int((rect[1] + rect[3]) // size))
+
+    def add_to_cells(self, item, cellRange):
+        x1, y1, x2, y2 = cellRange
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                cell = self.cells.get((x, y))
+                if cell is None:
+                    cell = self.cells[(x, y)] = set()
+                cell.add(item)
+
+    def remove_from_cells(self, item, cellRange):
+        x1, y1, x2, y2 = cellRange
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                cell = self.cells.get((x, y))
+                if cell is not None:
+                    cell.discard(item)
+                    if not cell:
+                        del self.cells[(x, y)]
+
+    # adds an item or moves it if it is already in the grid
+    def update(self, item, rect):
+        cellRange = self.cell_range(rect)
+        oldRange = self.items.get(item)
+        if oldRange == cellRange:
+            return
+        if oldRange is not None:
+            self.remove_from_cells(item, oldRange)
+        self.add_to_cells(item, cellRange)
+        self.items[item] = cellRange
+
+    def insert(self, item, rect):
+        self.update(item, rect)
+
+    def remove(self, item):
+        cellRange = self.items.pop(item, None)
+        if cellRange is not None:
+            self.remove_from_cells(item, cellRange)
+
+    # returns every item in the cells a rect overlaps
+    def query(self, rect):
+        found = set()
+        x1, y1, x2, y2 = self.cell_range(rect)
+        cells = self.cells
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                cell = cells.get((x, y))
+                if cell:
+                    found.update(cell)
+        return found
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+class Broadphase(SpatialHash):
+    """
+    A spatial hash of collision rects used by PhysicsEntity.move. Physics entities are registered with their own rect and re-bucketed as they move, static rects like walls are registered once. Collision tests only check the rects in the cells around the moving rect.
+    """
+    def __init__(self, cellSize=64):
+        super().__init__(cellSize)
+        self.rects: dict[object, pygame.Rect] = {}
+        self.nextHandle = 0
+
+    # registers a physics entity, which keeps its place up to date as it moves
+    def add(self, entity):
+        self.rects[entity] = entity.rect
+        self.update(entity, entity.rect)
+        entity.broadphase = self
+
+    # registers a static rect, returns a handle to remove it with
+    def add_rect(self, rect):
+        handle = self.nextHandle
+        self.nextHandle += 1
+        self.rects[handle] = pygame.Rect(rect)
+        self.update(handle, self.rects[handle])
+        return handle
+
+    # moves an entity to the cells of its current rect
+    def move(self, item):
+        self.update(item, self.rects[item])
+
+    def remove(self, item):
+        super().remove(item)
+        if self.rects.pop(item, None) is not None and getattr(item, "broadphase", None) is self:
+            item.broadphase = None
+
+    def clear(self):
+        for item in self.rects:
+            if getattr(item, "broadphase", None) is self:
+                item.broadphase = None
+        super().clear()
+        self.rects.clear()
+
+    # returns the registered rects colliding with a rect
+    def collision_test(self, rect, exclude=None):
+        rects = self.rects
+        return [rects[item] for item in self.query(rect) if item is not exclude and rects[item].colliderect(rect)]
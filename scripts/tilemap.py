@@ -0,0 +1,116 @@
+# Modules
+import pygame
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Tilemap:
+    """
+    Draws a grid of tiles (rows of tile values, as returned by load_map, or columns when columnMajor is set, like the grid[x][y] dungeon generator and TileGrid) by pre-baking fixed size chunks of tiles into surfaces. Only chunks that intersect the view are blitted, and changing a tile only re-bakes the chunk that contains it. Tile values without an image in the tileset are left empty.
+    """
+    def __init__(self, grid, tileset: dict[object, pygame.Surface], tileSize=16, chunkSize=16, columnMajor=False):
+        self.grid = grid
+        self.tileset = tileset
+        self.tileSize = tileSize
+        self.chunkSize = chunkSize
+        self.columnMajor = columnMajor
+        self.chunks: dict[tuple[int, int], pygame.Surface] = {}
+        # size of the map in tiles
+        longest = max((len(line) for line in self.grid), default=0)
+        self.width, self.height = (len(self.grid), longest) if columnMajor else (longest, len(self.grid))
+
+    # the chunk containing a tile
+    def get_chunk(self, x, y):
+        return x // self.chunkSize, y // self.chunkSize
+
+    def get_tile(self, x, y):
+        if self.columnMajor:
+            x, y = y, x
+        if 0 <= y < len(self.grid) and 0 <= x < len(self.grid[y]):
+            return self.grid[y][x]
+        return None
+
+    # changes a tile and re-bakes its chunk the next time it is drawn
+    def set_tile(self, x, y, value):
+        if self.columnMajor:
+            self.grid[x][y] = value
+        else:
+            self.grid[y][x] = value
+        self.chunks.pop(self.get_chunk(x, y), None)
+
+    # re-bakes every chunk the next time it is drawn
+    def rebake(self):
+        self.chunks.clear()
+
+    # draws every tile of a chunk onto a surface
+    def bake_chunk(self, chunkX, chunkY):
+        pixels = self.chunkSize * self.tileSize
+        chunk = pygame.Surface((pixels, pixels), pygame.SRCALPHA)
+        blits = []
+        for y in range(chunkY * self.chunkSize, min((chunkY + 1) * self.chunkSize, self.height)):
+            for x in range(chunkX * self.chunkSize, min((chunkX + 1) * self.chunkSize, self.width)):
+                img = self.tileset.get(self.get_tile(x, y))
+                if img is not None:
+                    blits.append((img, ((x % self.chunkSize) * self.tileSize, (y % self.chunkSize) * self.tileSize)))
+        chunk.blits(blits, doreturn=False)
+        chunk = chunk.convert_alpha()
+        self.chunks[(chunkX, chunkY)] = chunk
+        return chunk
+
+    # draws the chunks inside the view onto a surface
+    def draw(self, surface, scroll):
+        pixels = self.chunkSize * self.tileSize
+        width, height = surface.get_size()
+        chunksWide = -(-self.width // self.chunkSize)
+        chunksHigh = -(-self.height // self.chunkSize)
+
+        x1 = max(0, int(scroll[0] // pixels))
+        y1 = max(0, int(scroll[1] // pixels))
+        x2 = min(chunksWide - 1, int((scroll[0] + width) // pixels))
+        y2 = min(chunksHigh - 1, int((scroll[1] + height) // pixels))
+
+        blits = []
+        for chunkY in range(y1, y2 + 1):
+            for chunkX in range(x1, x2 + 1):
+                chunk = self.chunks.get((chunkX, chunkY))
+                if chunk is None:
+                    chunk = self.bake_chunk(chunkX, chunkY)
+                blits.append((chunk, (chunkX * pixels - scroll[0], chunkY * pixels - scroll[1])))
+        surface.blits(blits, doreturn=False)
+
+class TileGrid:
+    """
+    The solid tiles of a map for collisions. Rather than keeping a rect for every wall, the cells a rect overlaps are worked out from the tile size, so a collision test only looks at a few cells however large the map is. Grids are rows of tile values (load_map), or columns when columnMajor is set (the grid[x][y] dungeon generator). By default 0 is solid, matching the walls of the generator.
+    """
+    def __init__(self, grid, tileSize=16, solid=(0, "0"), columnMajor=False, outsideSolid=False):
+        self.tileSize = tileSize
+        self.solidValues = set(solid)
+        self.outsideSolid = outsideSolid
+        if columnMajor:
+            grid = [list(row) for row in zip(*grid)]
+        self.width = max((len(row) for row in grid), default=0)
+        self.height = len(grid)
+        # 1 for solid cells, stored as rows
+        self.cells = [bytearray(1 if value in self.solidValues else 0 for value in row) for row in grid]
+
+    def is_solid(self, x, y):
+        if 0 <= y < self.height and 0 <= x < len(self.cells[y]):
+            return self.cells[y][x] == 1
+        return self.outsideSolid
+
+    def set_tile(self, x, y, value):
+        self.cells[y][x] = 1 if value in self.solidValues else 0
+
+    # returns the rects of the solid tiles a rect overlaps
+    def collision_test(self, rect, exclude=None):
+        size = self.tileSize
+        x1 = rect.left // size
+        x2 = (rect.right - 1) // size
+        y1 = rect.top // size
+        y2 = (rect.bottom - 1) // size
+        collisions = []
+        for y in range(y1, y2 + 1):
+            for x in range(x1, x2 + 1):
+                if self.is_solid(x, y):
+                    collisions.append(pygame.Rect(x * size, y * size, size, size))
+        return collisions
@@ -12,14 +12,70 @@ from scripts.camera import Camera
 
 logger = logging.getLogger(__name__)
 
+class RotationAtlas:
+    """
+    Every frame of a weapon pre-rotated around its pivot in fixed angle steps, both flipped and unflipped. Each entry stores the rotated surface and the offset from the pivot to the top left of the rotated image, and the muzzle offset from the pivot is stored for every step, so drawing and shooting are table lookups.
+    """
+    def __init__(self, frames, pivot, muzzleTransform, step=2):
+        self.step = step
+        self.steps = max(1, round(360 / step))
+        self.pivot = pygame.math.Vector2(pivot)
+        self.images: dict[tuple[pygame.Surface, bool], list[tuple[pygame.Surface, pygame.math.Vector2]]] = {}
+        self.muzzleOffsets: dict[bool, list[pygame.math.Vector2]] = {}
+
+        for frame in frames:
+            self.bake_frame(frame)
+        self.bake_muzzle(muzzleTransform)
+
+    # the index of the step closest to an angle
+    def index(self, angle):
+        return round(angle / self.step) % self.steps
+
+    # rotates a frame around the pivot at every step
+    def bake_frame(self, frame):
+        origin = pygame.math.Vector2()
+        for flip in (False, True):
+            img = pygame.transform.flip(frame, False, flip)
+            rotations = []
+            for i in range(self.steps):
+                rotated_img, rotated_rect = blit_rotate(img, origin, self.pivot, i * self.step)
+                rotations.append((rotated_img.convert_alpha(), pygame.math.Vector2(rotated_rect.topleft)))
+            self.images[(frame, flip)] = rotations
+
+    # rotates the offset from the pivot to the muzzle at every step
+    def bake_muzzle(self, muzzleTransform):
+        offset = pygame.math.Vector2(muzzleTransform) - self.pivot
+        flipped = pygame.math.Vector2(-offset.x, offset.y)
+        self.muzzleOffsets[False] = [offset.rotate(-i * self.step) for i in range(self.steps)]
+        self.muzzleOffsets[True] = [flipped.rotate(180 - i * self.step) for i in range(self.steps)]
+
+    # returns the rotated frame and its offset from the pivot
+    def get(self, frame, flip, angle):
+        rotations = self.images.get((frame, flip))
+        if rotations is None:
+            self.bake_frame(frame)
+            rotations = self.images[(frame, flip)]
+        return rotations[self.index(angle)]
+
+    # returns the offset from the pivot to the muzzle
+    def get_muzzle_offset(self, flip, angle):
+        return self.muzzleOffsets[flip][self.index(angle)]
+
 class Weapon(Entity):
-    def __init__(self, transform, muzzleTransform, size, tag, assets, bullet, camLayer=3, isScroll=True, animation="idle", pivot=(0, 0)):
+    def __init__(self, transform, muzzleTransform, size, tag, assets, bullet, camLayer=3, isScroll=True, animation="idle", pivot=(0, 0), atlasStep=None):
         super().__init__(transform, size, tag, assets, camLayer, isScroll, animation)
         self.bullet = bullet
         self.pivot = pygame.math.Vector2(pivot)
         self.rotation = 0
         self.localRotation = 0
         self.muzzleTransform = pygame.math.Vector2(muzzleTransform)
+        self.owner = None  # the entity holding the weapon, its bullets do not hit it
+
+        # rotation atlas, the weapon is rotated every frame when this is None
+        self.atlas = None
+        self.spin = None  # the last (key, image, offset) rotated while the weapon spins in place
+        if atlasStep:
+            self.atlas = RotationAtlas(self.assets[self.tag + "/" + self.action].images, self.pivot, self.muzzleTransform, atlasStep)
 
         # magazine
         self.maxMagazine = 200
@@ -36,15 +92,40 @@ class Weapon(Entity):
         self.shooting = False
 
     def copy(self):
-        return Weapon(self.transform, self.muzzleTransform, self.size, self.tag, self.assets, self.bullet, self.camLayer, self.isScroll, self.anim, self.pivot)
+        weapon = Weapon(self.transform, self.muzzleTransform, self.size, self.tag, self.assets, self.bullet, self.camLayer, self.isScroll, self.anim, self.pivot)
+        weapon.atlas = self.atlas
+        return weapon
+
+    # the rotated frame and its offset from the pivot, the atlas only holds the aim angles so a spinning weapon is rotated when drawn
+    def get_rotated(self):
+        if self.localRotation == 0:
+            return self.atlas.get(self.animation.img(), self.flip, self.rotation)
+
+        # spins around the centre of the image, then rotates around the pivot like the weapons without an atlas
+        key = (self.animation.img(), self.flip, self.rotation, self.localRotation)
+        if self.spin is None or self.spin[0] != key:
+            img = pygame.transform.rotate(pygame.transform.flip(key[0], False, self.flip), self.localRotation)
+            rotated_img, rotated_rect = blit_rotate(img, pygame.math.Vector2(), self.pivot, self.rotation)
+            self.spin = (key, rotated_img.convert_alpha(), pygame.math.Vector2(rotated_rect.topleft))
+        return self.spin[1], self.spin[2]
 
     @property
     def image(self) -> pygame.Surface:
+        if self.atlas is not None:
+            return self.get_rotated()[0]
+
         img = pygame.transform.rotate(pygame.transform.flip(self.animation.img(), False, self.flip), self.localRotation)
         rotated_img = blit_rotate(img, self.transform, self.pivot, self.rotation)
         self.transform = pygame.math.Vector2(rotated_img[1].x, rotated_img[1].y)
         self.rect = rotated_img[1]
         return rotated_img[0].convert_alpha()
+
+    # the top left of the rotated image, the transform is the pivot when using the atlas
+    @property
+    def drawTransform(self) -> pygame.math.Vector2:
+        if self.atlas is not None:
+            return self.transform + self.get_rotated()[1]
+        return self.transform
     
     # rotates the weapon at the cursors center
     def rotate_at_cursor(self, cursor, camera:Camera) -> None:
@@ -53,6 +134,9 @@ class Weapon(Entity):
         self.rotation = self.get_point_angle(get_center(cursor.location, cursor.size), camera.scroll)
 
     def get_muzzle_transform(self):
+        if self.atlas is not None:
+            return self.transform + self.atlas.get_muzzle_offset(self.flip, self.rotation)
+
         # calculate the offset from the pivot to the muzzle in the rotated image
         offset = self.muzzleTransform - self.pivot
         if self.flip: 
@@ -68,14 +152,21 @@ class Weapon(Entity):
     # shoot bullets
     def shoot(self, game):
         if self.canShoot and self.magazine > 0:
-            # create bullet at muzzle transform
-            bullet = self.bullet.copy()
             muzzleTransform = self.get_muzzle_transform()
-            bullet.start(muzzleTransform, self.rotation)
+            projectiles = getattr(game, "projectiles", None)
+            if projectiles is not None:
+                # bullets are stored in the games projectile system instead of as sprites
+                projectiles.spawn(projectiles.get_type(self.bullet), muzzleTransform, self.rotation, self.owner)
+            else:
+                # create bullet at muzzle transform, reusing an expired one when the game has a pool
+                pool = getattr(game, "bulletPool", None)
+                bullet = pool.acquire(self.bullet) if pool is not None else self.bullet.copy()
+                bullet.start(muzzleTransform, self.rotation)
+                bullet.owner = self.owner
 
-            # add to world and camera
-            game.bullets.add(bullet)
-            game.add_to_world(bullet)
+                # add to world and camera
+                game.bullets.add(bullet)
+                game.add_to_world(bullet)
 
             # start timer
             self.currentShootTime = self.shootTime
@@ -107,44 +198,129 @@ class Weapon(Entity):
             self.localRotation %= 360
             self.canShoot = False
 
+    # without the atlas the transform is moved when drawing, so it can not be interpolated
+    @property
+    def isInterpolated(self):
+        return self.atlas is not None
+
+    # keeps the rect around the rotated image without touching the transform
+    def update_rect(self):
+        img, offset = self.get_rotated()
+        self.rect.update(self.transform.x + offset.x, self.transform.y + offset.y, img.get_width(), img.get_height())
+
     # update the position of the weapon to the players 
     def update(self, entity, camera:Camera, dt, game):
+        self.owner = entity
         self.transform = entity.get_center().copy()
         self.rotate_at_cursor(entity.cursor, camera)
-        self.animation.update(dt)
+        if not self.animation.isBatched:
+            self.animation.update(dt)
         self.update_timers(dt)
 
+        if self.atlas is not None:
+            self.update_rect()
+
         if self.shooting:
             self.shoot(game)
+
 class Bullet(PhysicsEntity):
     def __init__(self, transform, size, tag, assets, rotation, camLayer=1, isScroll=True, animation="idle"):
         super().__init__(transform, size, tag, assets, camLayer, isScroll, animation)
         self.rotation = rotation
         self.speed = 300
+        self.damage = 10
+        self.owner = None  # the entity that fired the bullet
         self.timeAlive = 2
         self.currentTimeAlive = self.timeAlive
+        self.pool = None  # the pool the bullet returns to when it expires
+        self.template = None  # the bullet this was copied from by the pool
 
     # calculate the direction vector
     def calculate_direction(self) -> pygame.math.Vector2:
         return super().calculate_direction() * self.speed
     
     def copy(self):
-        return Bullet(self.transform, self.size, self.tag, self.assets, self.rotation, self.camLayer, self.isScroll, self.anim)
+        bullet = Bullet(self.transform, self.size, self.tag, self.assets, self.rotation, self.camLayer, self.isScroll, self.anim)
+        bullet.speed = self.speed
+        bullet.damage = self.damage
+        bullet.timeAlive = self.timeAlive
+        return bullet
 
     def start(self, transform, rotation):
         self.startTransform = transform.copy()
         self.rotation = rotation
         self.transform = self.startTransform
+        self.previousTransform.update(self.transform)
+        self.rect.x, self.rect.y = self.transform.x, self.transform.y
         self.direction = self.calculate_direction()
+        # reset in case the bullet is being reused
+        self.currentTimeAlive = self.timeAlive
+        self.animation.play(self.animation.clip)
 
     def update_timer(self, dt):
         self.currentTimeAlive -= dt * 1
         if self.currentTimeAlive < 0:
+            self.expire()
+
+    # removes the bullet from the game, returning it to its pool
+    def expire(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
             self.kill()
             self.remove()
 
     def update(self, dt):
         self.move(self.direction, [], dt)
-        self.animation.update(dt)
+        if not self.animation.isBatched:
+            self.animation.update(dt)
         self.update_timer(dt)
-        
+
+class BulletPool:
+    """
+    Reuses bullets instead of creating a new one for every shot. Free bullets are kept for each bullet type (the template bullet a weapon copies), the pool grows up to maxSize bullets per type and any bullets needed past that are created without a pool.
+    """
+    def __init__(self, maxSize=512):
+        self.maxSize = maxSize
+        self.free: dict[Bullet, list[Bullet]] = {}
+        self.sizes: dict[Bullet, int] = {}
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.overflows = 0
+
+    # creates a bullet that returns to this pool
+    def create(self, template):
+        bullet = template.copy()
+        bullet.pool = self
+        bullet.template = template
+        self.sizes[template] = self.sizes.get(template, 0) + 1
+        return bullet
+
+    # fills the pool with bullets of a type ahead of time
+    def preallocate(self, template, count):
+        free = self.free.setdefault(template, [])
+        for i in range(min(count, self.maxSize - self.sizes.get(template, 0))):
+            free.append(self.create(template))
+
+    # returns a free bullet of a type
+    def acquire(self, template):
+        free = self.free.setdefault(template, [])
+        if free:
+            self.hits += 1
+            return free.pop()
+
+        self.misses += 1
+        if self.sizes.get(template, 0) < self.maxSize:
+            return self.create(template)
+        self.overflows += 1
+        return template.copy()
+
+    # takes an expired bullet out of the game and back into the pool
+    def release(self, bullet):
+        bullet.kill()
+        self.free[bullet.template].append(bullet)
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "overflows": self.overflows, "size": sum(self.sizes.values()), "free": sum(len(free) for free in self.free.values())}